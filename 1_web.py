@@ -2,67 +2,120 @@
 # scraping data from
 # "America's Best Large Employers 2021, Forbes",
 # https://www.forbes.com/best-large-employers/
+# other lists/years are scraped by changing LIST_NAME and YEAR, every record carries both
+# so that 3_database.py stores it in the right snapshot
 
 
 from selenium import webdriver
 from selenium.webdriver.support.ui import Select
-import time
+import os
+import sys
 import requests
-from bs4 import BeautifulSoup
+from fetcher import Fetcher
+from journal import Journal, compact
+from http_cache import HttpCache
+from listing_parser import parse_listing, parse_listing_html
+from profile_parser import parse_profile
+
+LIST_NAME = 'best-large-employers'
+YEAR = 2021
+
+# the listing table is parsed without a browser from LISTING_SOURCE, a saved copy of the rendered
+# page (or of the JSON the table is built from) or a url serving one of them;
+# Selenium (Chrome) is only started when that fails
+LISTING_URL = f'https://www.forbes.com/{LIST_NAME}/'
+LISTING_SOURCE = f'{LIST_NAME}-{YEAR}.html'
+
+# profile pages are fetched concurrently, but never faster than
+# RATE_PER_HOST requests/second from forbes.com (the old loop slept 30 s between requests)
+MAX_WORKERS = 8
+RATE_PER_HOST = 0.5
+
+# every scraped record is appended here as soon as it is done,
+# a restarted run skips the urls already in the journal
+JOURNAL_FILE = f'companies_journal_{LIST_NAME}_{YEAR}.jsonl'
+
+# profile pages are cached on disk, pages younger than CACHE_TTL seconds are not requested again
+# and older ones are revalidated with a conditional request (ETag / Last-Modified);
+# with OFFLINE = True the headquarters/description extraction only reads cached pages
+CACHE_DIR = '.http_cache'
+CACHE_TTL = 7 * 24 * 3600
+OFFLINE = False
 
 # PLEASE DON'T RUN THIS PART
-# 1. to run Selenium, you need Chrome and chromedriver installed on your computer
-# 2. It takes ~5 hours to get full data and if interrupted earlier, it might corrupt
-# the 'companies_final.json' file 
+# 1. to run Selenium (only needed without LISTING_SOURCE), you need Chrome and chromedriver installed on your computer
+# 2. It takes ~20 minutes to get full data, if interrupted just run it again:
+# already scraped companies are kept in JOURNAL_FILE and 'companies_final.json'
+# is only written (atomically) once all of them are done
 """
-def main():
-    # Part 1 - scrapes javascript-generated content (data table and links) using Selenium
+def listing_from_source(source):
+    # a saved page/JSON payload is read from disk, anything else is fetched
+    if os.path.exists(source):
+        with open(source, 'rb') as f:
+            payload = f.read()
+    else:
+        page = requests.get(source, timeout=30)
+        page.raise_for_status()
+        payload = page.content
+    return parse_listing(payload)
+
+
+def listing_from_selenium():
+    # scrapes javascript-generated content (data table and links) using Selenium
     driver = webdriver.Chrome()
-    driver.get('https://www.forbes.com/best-large-employers/#77f4ac3ffb3e')
+    driver.get(LISTING_URL)
     select = Select(driver.find_element_by_xpath('//*[@id="fbs-table-dropdown"]'))
     select.select_by_visible_text('All')
-
-    companies_json = []
-    table = driver.find_element_by_xpath('//*[@id="row-3"]/div/ul/li/div/div/table')
-    rows = table.find_elements_by_tag_name('tr')
-    for row in rows:
-        cols = row.find_elements_by_tag_name('td')
-        if not cols: #skip empty cols at the beginning
-            continue
-        companies_json.append({"rank": cols[0].text, "name": cols[1].text, "industry": cols[2].text, "employees": cols[3].text, "year_founded": cols[4].text})
-
-
-    urls = []
-    for i in range(1, 501):
-        for elem in driver.find_elements_by_xpath(f'//*[@id="row-3"]/div/ul/li/div/div/table/tbody/tr[{i}]/td[2]/a'):
-            urls.append(elem.get_attribute("href"))
+    # the rendered table is parsed in one pass instead of a driver round trip per row
+    page_source = driver.page_source
+    driver.quit()
+    return parse_listing_html(page_source)
 
 
-    urls_clean = [url.replace("?list=best-employers/", "") for url in urls]
-    for i, url in enumerate(urls_clean):
-        companies_json[i]['url'] = url
+def main():
+    # Part 1 - scrapes the data table and links, from LISTING_SOURCE if possible and with Selenium otherwise
+    try:
+        companies_json = listing_from_source(LISTING_SOURCE)
+    except (OSError, ValueError, requests.RequestException) as e:
+        print(f"can't parse the listing from {LISTING_SOURCE} ({e}), falling back to Selenium")
+        companies_json = listing_from_selenium()
+    for company in companies_json:
+        company['list'] = LIST_NAME
+        company['year'] = YEAR
 
     # Part 2 - scrapes headquarters and description of each company by going into each url
-    for i, company in enumerate(companies_json):
-        page = requests.get(company['url'])
-        soup = BeautifulSoup(page.content, "lxml")
-        try:
-            hq_elem = soup.find(text="Headquarters").findNext('span').contents[0]
+    journal = Journal(JOURNAL_FILE)
+    done = journal.completed('url')
+    companies_by_url = {company['url']: company for company in companies_json if company['url'] not in done}
+    print(f"{len(done)} companies already scraped, {len(companies_by_url)} to go")
+    cache = HttpCache(CACHE_DIR, ttl=CACHE_TTL, offline=OFFLINE)
+    fetcher = Fetcher(max_workers=MAX_WORKERS, rate_per_host=RATE_PER_HOST, cache=cache)
+    failed = []
+    for url, page in fetcher.fetch_all(companies_by_url):
+        company = companies_by_url[url]
+        # connection errors, pages missing from the offline cache and still 429/5xx after the retries
+        # are not journaled, the next run fetches them again
+        if page is None or not page.ok:
+            print("failed - ", company['name'])
+            failed.append(company['name'])
+            continue
+        company['headquarters'], company['desc'] = parse_profile(page.content)
+        if company['headquarters'] != "-1":
             print(company['name'])
-            companies_json[i]['headquarters'] = hq_elem
-        except:
+        else:
             print("skipped - ", company['name'])
-            companies_json[i]['headquarters'] = "-1"
-        try:
-            desc_elem = soup.find('div', class_="profile-text").findNext('span')
-            companies_json[i]['desc'] = desc_elem.text
-        except:
-            companies_json[i]['desc'] = "-1"
-        time.sleep(30)
-
+        journal.append(company)
+    if failed:
+        # no companies_final.json with companies missing, the next run retries them first
+        journal.close()
+        cache.close()
+        print(f"{len(failed)} companies couldn't be fetched, run again to retry them")
+        sys.exit(1)
 
-    with open('companies_final.json', 'w') as f:
-        json.dump(companies_json, f, indent=3)
+    # compaction: journal -> companies_final.json in rank order
+    compact(journal, 'companies_final.json', [company['url'] for company in companies_json])
+    journal.close()
+    cache.close()
 
 
 if __name__ == "__main__":
@@ -1,41 +1,60 @@
 # Written by: Katerina Bosko
 # creating SQL database out of json
+# usage: python 3_database.py [companies_clean.json] [--list LIST] [--year YEAR] [--full | --rowwise]
+#        python 3_database.py --benchmark N   (bulk load vs row-by-row loop on N synthetic companies)
+# every list/year is stored as its own snapshot, loading one snapshot leaves the others untouched;
+# into an existing database only the differences are written, in one transaction, so the GUI can keep reading;
+# afterwards every snapshot is exported as memory-mapped columns to snapshots/ (see columnar.py)
+import argparse
 import json
+import os
 import sqlite3
+import tempfile
+import time
+from itertools import islice
 
+from cleaning import NUMERIC_RANGES, to_int
+from columnar import EXPORT_DIR, export_snapshot
+from companies_db import (DB_FILE, DEFAULT_LIST, DEFAULT_YEAR, check_query_plans, create_indexes, create_schema,
+                          drop_indexes, entity_keys, get_snapshot_id, refresh_histograms, resolve_entity, resume_sync,
+                          search_companies, suspend_sync)
 
-def main():
-    with open('companies_clean.json', 'r') as f:
-        companies_json = json.load(f)
+# pragmas for loading: WAL journal, fsync only at checkpoints, ~200 MB page cache, foreign keys enforced
+LOAD_PRAGMAS = ['PRAGMA journal_mode = WAL', 'PRAGMA synchronous = NORMAL', 'PRAGMA cache_size = -200000',
+                'PRAGMA temp_store = MEMORY', 'PRAGMA foreign_keys = ON']
 
-    conn = sqlite3.connect('companies.db')
-    cur = conn.cursor()
 
-    cur.execute("DROP TABLE IF EXISTS States")
-    cur.execute('''CREATE TABLE States(
-                    id INTEGER NOT NULL PRIMARY KEY,
-                    state TEXT UNIQUE ON CONFLICT IGNORE)''')
+# columns of Companies written by the loaders
+COMPANY_COLUMNS = 'snapshot_id, entity_id, rank, name, industry_id, state_id, employees, year_founded, desc, url'
+
 
-    cur.execute("DROP TABLE IF EXISTS Industries")
-    cur.execute('''CREATE TABLE Industries(
-                    id INTEGER NOT NULL PRIMARY KEY,
-                    industry TEXT UNIQUE ON CONFLICT IGNORE)''')
+def numbers(company):
+    # numbers are integers (NULL if missing) since 2_data_cleaning.py, older files still have "116,000"
+    return tuple(to_int(company[field], *NUMERIC_RANGES[field]) for field in ('rank', 'employees', 'year_founded'))
 
 
-    cur.execute("DROP TABLE IF EXISTS Companies")
-    cur.execute(f'''CREATE TABLE Companies(
-                    id INTEGER NOT NULL PRIMARY KEY UNIQUE,
-                    rank INTEGER,
-                    name TEXT,
-                    industry_id INTEGER,
-                    state_id INTEGER,
-                    employees INTEGER,
-                    year_founded INTEGER,
-                    desc TEXT,
-                    url TEXT)''')
+def snapshot_key(company, default_list, default_year):
+    return company.get('list', default_list), int(company.get('year', default_year))
 
 
+def load_rowwise(conn, companies_json, default_list=DEFAULT_LIST, default_year=DEFAULT_YEAR):
+    """
+    The original loader: an INSERT and a SELECT per dimension and an INSERT per company
+    :return: ids of the snapshots loaded
+    """
+    cur = conn.cursor()
+    snapshots = {}
+    # entities already loaded per snapshot, an entity appears once per snapshot
+    seen = {}
     for company in companies_json:
+        key = snapshot_key(company, default_list, default_year)
+        if key not in snapshots:
+            # (re)loading a snapshot replaces only its own rows
+            snapshots[key] = get_snapshot_id(cur, *key, create=True)
+            cur.execute('DELETE FROM Companies WHERE snapshot_id = ?', (snapshots[key], ))
+            seen[key] = set()
+        snapshot_id = snapshots[key]
+
         cur.execute('''INSERT INTO States (state) VALUES (?)''', (company['state'], ))
         cur.execute('SELECT id FROM States WHERE state = ? ', (company['state'], ))
         state_id = cur.fetchone()[0]
@@ -44,12 +63,302 @@ def main():
         cur.execute('SELECT id FROM Industries WHERE industry = ? ', (company['industry'], ))
         industry_id = cur.fetchone()[0]
 
-        cur.execute(f'''INSERT INTO Companies (rank, name, industry_id, state_id,
-                        employees, year_founded, desc, url)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (company['rank'], company['name'], industry_id, state_id, company['employees'],
-                    company['year_founded'], company['desc'], company['url']))
+        entity_id = resolve_entity(cur, company['name'], company['url'])
+        if entity_id in seen[key]:
+            print(f"warning: skipping {company['name']}, its company is already in {key[0]} {key[1]}")
+            continue
+        seen[key].add(entity_id)
+        rank, employees, year_founded = numbers(company)
+
+        cur.execute(f'''INSERT INTO Companies ({COMPANY_COLUMNS})
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (snapshot_id, entity_id, rank, company['name'], industry_id, state_id,
+                    employees, year_founded, company['desc'], company['url']))
+    for snapshot_id in snapshots.values():
+        refresh_histograms(cur, snapshot_id)
+    conn.commit()
+    return sorted(snapshots.values())
+
+
+class Dimensions:
+    """
+    States, industries and entity keys resolved through dicts held in memory, a statement is only run
+    for values seen for the first time
+    """
+    def __init__(self, cur):
+        self._cur = cur
+        self._states = dict(cur.execute('SELECT state, id FROM States'))
+        self._industries = dict(cur.execute('SELECT industry, id FROM Industries'))
+        self._keys = dict(cur.execute('SELECT key, entity_id FROM EntityKeys'))
+        self._new_keys = []
+
+    def _id(self, mapping, table, column, value):
+        if value not in mapping:
+            self._cur.execute(f'INSERT INTO {table} ({column}) VALUES (?)', (value, ))
+            mapping[value] = self._cur.lastrowid
+        return mapping[value]
+
+    def state_id(self, state):
+        return self._id(self._states, 'States', 'state', state)
+
+    def industry_id(self, industry):
+        return self._id(self._industries, 'Industries', 'industry', industry)
+
+    def entity_id(self, company):
+        """
+        Same resolution as companies_db.resolve_entity, new keys are written by flush
+        """
+        keys = entity_keys(company['name'], company['url'])
+        found = next((self._keys[key] for key in keys if key in self._keys), None)
+        if found is None:
+            self._cur.execute('INSERT INTO Entities (name) VALUES (?)', (company['name'], ))
+            found = self._cur.lastrowid
+        for key in keys:
+            if key not in self._keys:
+                self._keys[key] = found
+                self._new_keys.append((key, found))
+        return found
+
+    def flush(self):
+        self._cur.executemany('INSERT OR IGNORE INTO EntityKeys (key, entity_id) VALUES (?, ?)', self._new_keys)
+        self._new_keys = []
+
+    def row(self, company):
+        """
+        :param company: cleaned record
+        :return: entity id, (rank, name, industry_id, state_id, employees, year_founded, desc, url)
+        """
+        rank, employees, year_founded = numbers(company)
+        return self.entity_id(company), (rank, company['name'], self.industry_id(company['industry']),
+                                         self.state_id(company['state']), employees, year_founded,
+                                         company['desc'], company['url'])
+
+
+def load_bulk(conn, companies_json, default_list=DEFAULT_LIST, default_year=DEFAULT_YEAR, batch_size=10000):
+    """
+    Bulk loader: dimensions are resolved in memory (see Dimensions), companies are inserted with
+    executemany in batches, everything in one transaction. Into an empty Companies table the
+    indexes, the full-text index and the per-industry/state counts are built once after the data instead of
+    being updated row by row
+    :return: ids of the snapshots loaded
+    """
+    cur = conn.cursor()
+    dimensions = Dimensions(cur)
+    snapshots = {}
+    # entities already loaded per snapshot, an entity appears once per snapshot
+    seen = {}
+
+    fresh = cur.execute('SELECT 1 FROM Companies LIMIT 1').fetchone() is None
+    if fresh:
+        drop_indexes(cur)
+        suspend_sync(cur)
+
+    companies_json = iter(companies_json)
+    while True:
+        batch = list(islice(companies_json, batch_size))
+        if not batch:
+            break
+        rows = []
+        for company in batch:
+            key = snapshot_key(company, default_list, default_year)
+            if key not in snapshots:
+                # (re)loading a snapshot replaces only its own rows
+                snapshots[key] = get_snapshot_id(cur, *key, create=True)
+                cur.execute('DELETE FROM Companies WHERE snapshot_id = ?', (snapshots[key], ))
+                seen[key] = set()
+            entity_id, values = dimensions.row(company)
+            if entity_id in seen[key]:
+                print(f"warning: skipping {company['name']}, its company is already in {key[0]} {key[1]}")
+                continue
+            seen[key].add(entity_id)
+            rows.append((snapshots[key], entity_id, *values))
+        cur.executemany(f'''INSERT INTO Companies ({COMPANY_COLUMNS})
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+        dimensions.flush()
+
+    if fresh:
+        create_indexes(cur)
+        resume_sync(cur)
+    for snapshot_id in snapshots.values():
+        refresh_histograms(cur, snapshot_id)
+    conn.commit()
+    return sorted(snapshots.values())
+
+
+def load_incremental(conn, companies_json, default_list=DEFAULT_LIST, default_year=DEFAULT_YEAR):
+    """
+    Diff loader: the records of every snapshot are compared to its rows by natural key (the entity),
+    only new, changed and vanished companies are written (INSERT/UPDATE/DELETE), all in one transaction.
+    Readers (the GUI, in WAL mode) keep seeing the previous data until the commit, and reloading an
+    unchanged file writes nothing
+    :return: (dict with the number of inserted, updated, deleted and unchanged companies,
+              ids of the snapshots with at least one change)
+    """
+    cur = conn.cursor()
+    dimensions = Dimensions(cur)
+    incoming = {}
+    for company in companies_json:
+        key = snapshot_key(company, default_list, default_year)
+        if key not in incoming:
+            incoming[key] = {}
+        entity_id, values = dimensions.row(company)
+        if entity_id in incoming[key]:
+            print(f"warning: skipping {company['name']}, its company is already in {key[0]} {key[1]}")
+            continue
+        incoming[key][entity_id] = values
+    dimensions.flush()
+
+    counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    changed = []
+    for key, rows in incoming.items():
+        snapshot_id = get_snapshot_id(cur, *key, create=True)
+        existing = {row[1]: (row[0], row[2:]) for row in
+                    cur.execute(f'SELECT id, {COMPANY_COLUMNS[len("snapshot_id, "):]} FROM Companies '
+                                'WHERE snapshot_id = ?', (snapshot_id, ))}
+        inserts, updates = [], []
+        for entity_id, values in rows.items():
+            if entity_id not in existing:
+                inserts.append((snapshot_id, entity_id, *values))
+            elif existing[entity_id][1] != values:
+                updates.append((*values, existing[entity_id][0]))
+        deletes = [(company_id, ) for entity_id, (company_id, values) in existing.items() if entity_id not in rows]
+
+        cur.executemany('DELETE FROM Companies WHERE id = ?', deletes)
+        cur.executemany('''UPDATE Companies SET rank = ?, name = ?, industry_id = ?, state_id = ?, employees = ?,
+                           year_founded = ?, desc = ?, url = ?
+                           WHERE id = ?''', updates)
+        cur.executemany(f'''INSERT INTO Companies ({COMPANY_COLUMNS})
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', inserts)
+        counts['inserted'] += len(inserts)
+        counts['updated'] += len(updates)
+        counts['deleted'] += len(deletes)
+        counts['unchanged'] += len(rows) - len(inserts) - len(updates)
+        # the per-industry/state counts follow the changes through triggers, the outliers of the
+        # histograms depend on all values of the snapshot
+        if inserts or updates or deletes:
+            refresh_histograms(cur, snapshot_id)
+            changed.append(snapshot_id)
     conn.commit()
+    return counts, changed
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    for pragma in LOAD_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+# words of the synthetic descriptions
+WORDS = ("health care hospital bank insurance software cloud retail grocery energy utility airline logistics "
+         "pharmaceutical research university school government defense semiconductor automotive telecom media "
+         "restaurant hotel construction chemical consulting payments mining steel apparel beverage").split()
+
+
+def synthetic_companies(n):
+    """
+    n made-up cleaned company records, 40 industries and 56 states, descriptions of about 30 common words
+    and one rare tag (shared by one company in 20000)
+    """
+    for i in range(n):
+        words = " ".join(WORDS[(i * 7 + j * j * 13) % len(WORDS)] for j in range(30))
+        yield {"rank": i + 1, "name": f"Company {i}", "industry": f"Industry {i % 40}", "employees": 1000 + i % 50000,
+               "year_founded": 1800 + i % 220, "url": f"https://www.forbes.com/companies/company-{i}/",
+               "headquarters": f"City {i % 1000}, State {i % 56}", "desc": f"Company {i} works in {words}, tag{i * 31 % 20000}.",
+               "state": f"State {i % 56}"}
+
+
+def benchmark(n):
+    """
+    Time the row-by-row loop and the bulk loader on n synthetic companies, each into a new database,
+    then full-text search against a LIKE scan on the result
+    """
+    for label, load in (("row-by-row", load_rowwise), ("bulk", load_bulk)):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'benchmark.db')
+            conn = sqlite3.connect(path) if load is load_rowwise else connect(path)
+            create_schema(conn.cursor())
+            start = time.perf_counter()
+            load(conn, synthetic_companies(n))
+            elapsed = time.perf_counter() - start
+            count = conn.execute('SELECT COUNT(*) FROM Companies').fetchone()[0]
+            print(f"{label:>10}: {count:,} companies in {elapsed:.1f}s ({count / elapsed:,.0f} rows/s)")
+            if load is load_bulk:
+                benchmark_search(conn.cursor())
+                benchmark_reload(conn, n)
+            conn.close()
+
+
+def benchmark_reload(conn, n, changed=0.01):
+    """
+    Reload the n synthetic companies with a share of them changed, diff loader against delete-and-reload
+    """
+    step = int(1 / changed)
+
+    def modified():
+        for i, company in enumerate(synthetic_companies(n)):
+            if i % step == 0:
+                company['employees'] += 1
+            yield company
+
+    start = time.perf_counter()
+    counts, _ = load_incremental(conn, modified())
+    incremental = time.perf_counter() - start
+    start = time.perf_counter()
+    load_bulk(conn, modified())
+    full = time.perf_counter() - start
+    print(f"    reload with {changed:.0%} changed: diff {incremental:.1f}s ({counts['updated']:,} updated), "
+          f"delete and reload {full:.1f}s")
+
+
+def benchmark_search(cur, text="tag1234", repeat=20):
+    snapshot_id = get_snapshot_id(cur, DEFAULT_LIST, DEFAULT_YEAR)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        found = search_companies(cur, snapshot_id, text)
+    fts = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    cur.execute('''SELECT name FROM Companies WHERE snapshot_id = ? AND (name LIKE ? OR desc LIKE ?) LIMIT 50''',
+                (snapshot_id, f'%{text}%', f'%{text}%')).fetchall()
+    like = time.perf_counter() - start
+    print(f"    search \"{text}\": full-text {fts * 1000:.1f} ms ({len(found)} results), LIKE scan {like * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load cleaned companies into companies.db")
+    parser.add_argument('input', nargs='?', default='companies_clean.json')
+    parser.add_argument('--list', default=DEFAULT_LIST, help="list the records belong to (unless they say otherwise)")
+    parser.add_argument('--year', type=int, default=DEFAULT_YEAR, help="year of the list (unless the records say otherwise)")
+    parser.add_argument('--full', action='store_true',
+                        help="delete the snapshot and load it again instead of applying only the differences")
+    parser.add_argument('--rowwise', action='store_true', help="use the old row-by-row loop instead of the bulk loader")
+    parser.add_argument('--benchmark', type=int, metavar='N', help="compare both loaders on N synthetic companies")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+
+    with open(args.input, 'r') as f:
+        companies_json = json.load(f)
+
+    conn = connect(DB_FILE)
+    create_schema(conn.cursor())
+    if args.rowwise:
+        changed = load_rowwise(conn, companies_json, args.list, args.year)
+    elif args.full or conn.execute('SELECT 1 FROM Companies LIMIT 1').fetchone() is None:
+        changed = load_bulk(conn, companies_json, args.list, args.year)
+    else:
+        counts, changed = load_incremental(conn, companies_json, args.list, args.year)
+        print(", ".join(f"{count} {change}" for change, count in counts.items()))
+    # refresh the statistics of the query planner, then make sure the GUI queries still use the indexes
+    conn.execute('PRAGMA optimize')
+    for name, step in check_query_plans(conn.cursor()):
+        print(f"warning: query {name} does a full scan: {step}")
+    # columnar copy for analytics (and the columnar trend backend of main.py), only of the snapshots that
+    # changed: a load costs what it changes, not the whole history (python columnar.py exports everything)
+    for snapshot_id in changed:
+        print("exported", export_snapshot(conn, snapshot_id, EXPORT_DIR))
     conn.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+# persistent cache of cleaned records for 2_data_cleaning.py
+# a record is only cleaned again when its raw content or the rules that apply to it changed:
+# the cache key is a hash of the raw record, of the rule code/lookup tables and of the manual fixes for its name
+import hashlib
+import inspect
+import json
+import sqlite3
+import time
+from collections import deque
+from itertools import islice
+
+import cleaning
+import college_index
+import state_matcher
+
+# entries not used for this long are dropped
+MAX_AGE = 30 * 24 * 3600
+
+
+def rules_fingerprint(colleges_path='topcolleges.csv'):
+    """
+    Hash of everything every record depends on: the code of the rules, the state names and topcolleges.csv
+    (the per-name manual tables are hashed per record, see record_key)
+    :param colleges_path: topcolleges.csv
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    # every function of cleaning.py, so new rules are covered as well
+    for name, function in inspect.getmembers(cleaning, inspect.isfunction):
+        if function.__module__ == cleaning.__name__:
+            digest.update(inspect.getsource(function).encode())
+    for module in (state_matcher, college_index):
+        digest.update(inspect.getsource(module).encode())
+    digest.update(json.dumps([cleaning.US_STATE_ABBREV, cleaning.NUMERIC_RANGES]).encode())
+    with open(colleges_path, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def record_key(company, fingerprint):
+    """
+    :param company: raw record
+    :param fingerprint: see rules_fingerprint
+    :return: cache key of the cleaned record
+    """
+    manual = [cleaning.STATES_FOR_MISSING.get(company['name']), cleaning.MANUAL_FIXES.get(company['name'])]
+    digest = hashlib.sha256(fingerprint.encode())
+    digest.update(json.dumps(company, sort_keys=True).encode())
+    digest.update(json.dumps(manual, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class CleanCache:
+    """
+    sqlite table cache key -> cleaned record (json)
+    """
+    def __init__(self, path='.clean_cache.db'):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS Cleaned(
+                                key TEXT NOT NULL PRIMARY KEY,
+                                record TEXT NOT NULL,
+                                used_at REAL NOT NULL) WITHOUT ROWID''')
+        self._now = time.time()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """
+        :param keys: list of cache keys
+        :return: dict key -> cleaned record (json) for the keys in the cache
+        """
+        found = {}
+        # stay below sqlite's limit of host parameters per statement
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            found.update(self._conn.execute(f'SELECT key, record FROM Cleaned WHERE key IN '
+                                            f'({",".join("?" * len(part))})', part))
+        self._conn.executemany('UPDATE Cleaned SET used_at = ? WHERE key = ?', ((self._now, key) for key in found))
+        return found
+
+    def put_many(self, entries):
+        """
+        :param entries: dict key -> cleaned record (json)
+        :return: nothing
+        """
+        self._conn.executemany('INSERT OR REPLACE INTO Cleaned VALUES (?, ?, ?)',
+                               ((key, record, self._now) for key, record in entries.items()))
+
+    def close(self):
+        self._conn.execute('DELETE FROM Cleaned WHERE used_at < ?', (self._now - MAX_AGE,))
+        self._conn.commit()
+        self._conn.close()
+
+
+def clean_records_cached(records, cleaner, cache, fingerprint, batch_size=5000):
+    """
+    Serve unchanged records from the cache and send only the rest through the cleaner,
+    output order is the input order. The cleaner gets a stream of misses and reads ahead in it
+    (e.g. cleaning.clean_records_parallel keeps every worker busy); the records read on the way that are
+    in the cache wait in memory until their turn, so when more than batch_size of them wait the stream
+    ends, the cleaner's results are drained and the cleaner is called again on the next misses
+    (for clean_records_parallel, pass it a pool from cleaning.cleaning_pool to not start workers every time)
+    :param records: iterable of raw records
+    :param cleaner: function iterable of raw records -> iterable of cleaned records (same order),
+                    e.g. lambda records: cleaning.clean_records(records, rules), may be called several times
+    :param cache: CleanCache, its hits/misses counters are updated
+    :param fingerprint: see rules_fingerprint
+    :param batch_size: records looked up in the cache (and cleaned records stored) at once
+    :return: generator of cleaned records
+    """
+    records = iter(records)
+    # (key, cached record or None for a miss) in input order, and the misses the cleaner didn't take yet
+    order = deque()
+    feed = deque()
+    exhausted = False
+    # cached records in order
+    waiting = 0
+
+    def read_batch():
+        nonlocal exhausted, waiting
+        batch = list(islice(records, batch_size))
+        if not batch:
+            exhausted = True
+            return
+        keys = [record_key(company, fingerprint) for company in batch]
+        cached = cache.get_many(keys)
+        for key, company in zip(keys, batch):
+            order.append((key, cached.get(key)))
+            if key in cached:
+                waiting += 1
+            else:
+                feed.append(company)
+
+    def misses():
+        # the cleaner reads ahead: more batches are looked up when it asks for the next miss,
+        # until too many cached records wait for the misses before them
+        while True:
+            while not feed:
+                if exhausted or waiting > batch_size:
+                    return
+                read_batch()
+            yield feed.popleft()
+
+    cleaned = iter(())
+    new_entries = {}
+    while True:
+        if not order:
+            if exhausted:
+                break
+            read_batch()
+            continue
+        key, record = order.popleft()
+        if record is not None:
+            waiting -= 1
+            cache.hits += 1
+            yield json.loads(record)
+            continue
+        cache.misses += 1
+        company = next(cleaned, None)
+        if company is None:
+            # every miss given to the cleaner is cleaned, this one was read after its stream ended
+            cleaned = iter(cleaner(misses()))
+            company = next(cleaned)
+        new_entries[key] = json.dumps(company)
+        if len(new_entries) >= batch_size:
+            cache.put_many(new_entries)
+            new_entries = {}
+        yield company
+    cache.put_many(new_entries)
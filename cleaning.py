@@ -0,0 +1,385 @@
+# record-level cleaning rules of 2_data_cleaning.py and streaming JSON/JSONL reading and writing
+# every rule takes one company record and returns it cleaned, so the whole cleaning is a single
+# pass over a stream of records and memory does not depend on the size of the input
+import csv
+import json
+import re
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from state_matcher import StateMatcher
+
+US_STATE_ABBREV = {
+    'Alabama': 'AL',
+    'Alaska': 'AK',
+    'American Samoa': 'AS',
+    'Arizona': 'AZ',
+    'Arkansas': 'AR',
+    'California': 'CA',
+    'Colorado': 'CO',
+    'Connecticut': 'CT',
+    'Delaware': 'DE',
+    'District of Columbia': 'DC',
+    'Florida': 'FL',
+    'Georgia': 'GA',
+    'Guam': 'GU',
+    'Hawaii': 'HI',
+    'Idaho': 'ID',
+    'Illinois': 'IL',
+    'Indiana': 'IN',
+    'Iowa': 'IA',
+    'Kansas': 'KS',
+    'Kentucky': 'KY',
+    'Louisiana': 'LA',
+    'Maine': 'ME',
+    'Maryland': 'MD',
+    'Massachusetts': 'MA',
+    'Michigan': 'MI',
+    'Minnesota': 'MN',
+    'Mississippi': 'MS',
+    'Missouri': 'MO',
+    'Montana': 'MT',
+    'Nebraska': 'NE',
+    'Nevada': 'NV',
+    'New Hampshire': 'NH',
+    'New Jersey': 'NJ',
+    'New Mexico': 'NM',
+    'New York': 'NY',
+    'North Carolina': 'NC',
+    'North Dakota': 'ND',
+    'Northern Mariana Islands':'MP',
+    'Ohio': 'OH',
+    'Oklahoma': 'OK',
+    'Oregon': 'OR',
+    'Pennsylvania': 'PA',
+    'Puerto Rico': 'PR',
+    'Rhode Island': 'RI',
+    'South Carolina': 'SC',
+    'South Dakota': 'SD',
+    'Tennessee': 'TN',
+    'Texas': 'TX',
+    'Utah': 'UT',
+    'Vermont': 'VT',
+    'Virgin Islands': 'VI',
+    'Virginia': 'VA',
+    'Washington': 'WA',
+    'West Virginia': 'WV',
+    'Wisconsin': 'WI',
+    'Wyoming': 'WY'
+}
+
+# reversed dictionary of states
+ABBREV_US_STATE = dict(map(reversed, US_STATE_ABBREV.items()))
+
+STATE_MATCHER = StateMatcher(US_STATE_ABBREV)
+
+# manual substitution for the remaining companies w/o state
+# (universities spelled differently than in topcolleges.csv are found by college_index)
+STATES_FOR_MISSING = {'AstraZeneca': 'International',
+                      'GlaxoSmithKline': 'International',
+                      'CWT': 'Minnesota',
+                      'BP': 'International'}
+
+# manual fixes of single records
+MANUAL_FIXES = {
+    # there is 1 company with missing data for employees adding manually data
+    'Consolidated Electrical Distributors': {'employees': 6000},
+    # there is 1 company with wrong location attribution
+    'University of Illinois-Urbana-Champaign': {'state': 'Illinois'},
+}
+
+
+def load_colleges(path='topcolleges.csv'):
+    """
+    :param path: csv file with the columns Name and State (abbreviation)
+    :return: dict college name -> list of state abbreviations
+    """
+    colleges_dict = defaultdict(list)
+    with open(path, 'r') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=',')
+        for row in reader:
+            colleges_dict[row['Name']].append(row['State'])
+    return dict(colleges_dict)
+
+
+# DATA CLEANING
+def extract_state(company):
+    """
+    Getting the state out of "City, State" headquarters and encoding companies w/o state as international
+    """
+    splitted = company['headquarters'].split(',')
+    if len(splitted) > 1:
+        # "City, Region" outside of the US counts as international as well
+        state = splitted[1].strip()
+        company['state'] = state if state in US_STATE_ABBREV else 'International'
+    elif splitted[0] == '-1':
+        company['state'] = '-1'
+    else:
+        company['state'] = 'International'
+    return company
+
+
+def clean_desc(company):
+    """
+    Cut the description after its last "." (some of them end abruptly in the middle of the sentence)
+    """
+    if company['desc'] != "-1":
+        splitted = company['desc'].split(".")
+        company['desc'] = ".".join(splitted[:-1])+"."
+    return company
+
+
+# DEALING WITH MISSING DATA
+def college_state(colleges_dict, college_index=None):
+    """
+    :param colleges_dict: see load_colleges
+    :param college_index: college_index.CollegeIndex for names that aren't spelled exactly as in the csv
+    :return: rule adding the state of universities found in topcolleges.csv
+    """
+    def rule(company):
+        # double substitution - find state abbrv from topcolleges
+        # and add full state name based on ABBREV_US_STATE dictionary
+        if company['name'] in colleges_dict:
+            state_abbrv = colleges_dict[company['name']][0]
+            if state_abbrv in ABBREV_US_STATE:
+                company['state'] = ABBREV_US_STATE[state_abbrv]
+        elif company['state'] == '-1' and college_index is not None:
+            # approximate match, only for companies that still have no state
+            match = college_index.lookup(company['name'])
+            if match is not None and match[1] in ABBREV_US_STATE:
+                company['state'] = ABBREV_US_STATE[match[1]]
+        return company
+    return rule
+
+
+def state_from_name(company):
+    """
+    If universities have state in their names
+    """
+    if company['state'] == '-1':
+        state = STATE_MATCHER.find(company['name'])
+        if state is not None:
+            company['state'] = state
+    return company
+
+
+def manual_state(company):
+    """
+    Substitute manually from STATES_FOR_MISSING
+    """
+    if company['state'] == '-1':
+        company['state'] = STATES_FOR_MISSING[company['name']]
+    return company
+
+
+def manual_fixes(company):
+    company.update(MANUAL_FIXES.get(company['name'], {}))
+    return company
+
+
+# TYPED NUMBERS
+# rank, employees and year_founded are stored as integers, missing or invalid values as null
+NUMERIC_RANGES = {'rank': (1, 10 ** 6), 'employees': (1, 10 ** 8), 'year_founded': (1000, 2100)}
+
+
+def to_int(value, low, high):
+    """
+    "116,000" -> 116000, missing ("-1", "") or out of [low, high] -> None
+    """
+    if isinstance(value, str):
+        value = value.replace(',', '').strip()
+        if not value.lstrip('-').isdigit():
+            return None
+    if value is None or isinstance(value, bool):
+        return None
+    value = int(value)
+    return value if low <= value <= high else None
+
+
+def normalize_numbers(company):
+    for field, (low, high) in NUMERIC_RANGES.items():
+        if field in company:
+            company[field] = to_int(company[field], low, high)
+    return company
+
+
+def make_rules(colleges_dict, college_index=None):
+    """
+    :param colleges_dict: see load_colleges
+    :param college_index: see college_state
+    :return: list of the cleaning rules in the order they are applied
+    """
+    return [extract_state, clean_desc, college_state(colleges_dict, college_index), state_from_name, manual_state,
+            manual_fixes, normalize_numbers]
+
+
+def clean_record(company, rules):
+    for rule in rules:
+        company = rule(company)
+    return company
+
+
+def clean_records(records, rules):
+    """
+    Lazily apply the rules to a stream of records
+    :param records: iterable of raw company records
+    :param rules: list of rules, see make_rules
+    :return: generator of cleaned records
+    """
+    for company in records:
+        yield clean_record(company, rules)
+
+
+# PARALLEL CLEANING
+# rules of the worker process, built once by the pool initializer instead of being pickled with every chunk
+_worker_rules = None
+
+
+def _init_worker(colleges_path):
+    global _worker_rules
+    from college_index import load_index
+    _worker_rules = make_rules(load_colleges(colleges_path), load_index(colleges_path))
+
+
+def _clean_chunk(chunk):
+    return [clean_record(company, _worker_rules) for company in chunk]
+
+
+def cleaning_pool(workers, colleges_path='topcolleges.csv'):
+    """
+    :param workers: number of worker processes
+    :param colleges_path: topcolleges.csv, every worker loads it (and the college index) once at start
+    :return: ProcessPoolExecutor for clean_records_parallel, to clean several streams without starting
+             the workers again
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(colleges_path,))
+
+
+def clean_records_parallel(records, workers, colleges_path='topcolleges.csv', chunk_size=2000, pool=None):
+    """
+    Apply the rules in a process pool, chunk by chunk; chunks are yielded in input order,
+    so the output is identical to clean_records. At most 2 chunks per worker are in flight,
+    memory stays bounded for any input size
+    :param records: iterable of raw company records
+    :param workers: number of worker processes
+    :param colleges_path: topcolleges.csv, every worker loads it (and the college index) once at start
+    :param chunk_size: records per task
+    :param pool: pool made by cleaning_pool, left running; a pool is started (and shut down) if None
+    :return: generator of cleaned records
+    """
+    if pool is None:
+        with cleaning_pool(workers, colleges_path) as pool:
+            yield from clean_records_parallel(records, workers, colleges_path, chunk_size, pool)
+        return
+    records = iter(records)
+    pending = deque()
+    while True:
+        while len(pending) < 2 * workers:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            pending.append(pool.submit(_clean_chunk, chunk))
+        if not pending:
+            return
+        yield from pending.popleft().result()
+
+
+# STREAMING INPUT/OUTPUT
+_SEPARATOR = re.compile(r'[\s,]*')
+
+
+def read_records(path, chunk_size=1 << 16):
+    """
+    Stream records from a JSON file holding one list of objects, or from a JSONL file (one object per line),
+    only one record (plus a read buffer) is in memory at a time
+    :param path: input file
+    :return: generator of records
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            # JSONL
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        pos = 1
+        while True:
+            # skip whitespace and the comma between records
+            match = _SEPARATOR.match(buffer, pos)
+            pos = match.end()
+            if buffer.startswith(']', pos):
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                # the record continues in the next chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield record
+
+
+def write_records(records, path):
+    """
+    Stream records to a JSONL file, or to a JSON file formatted exactly like json.dump(list, f, indent=3)
+    :param records: iterable of records
+    :param path: output file (.jsonl for JSONL)
+    :return: number of records written
+    """
+    count = 0
+    with open(path, 'w') as f:
+        if path.endswith('.jsonl'):
+            for count, record in enumerate(records, 1):
+                f.write(json.dumps(record) + '\n')
+            return count
+        for count, record in enumerate(records, 1):
+            f.write('[\n   ' if count == 1 else ',\n   ')
+            f.write(json.dumps(record, indent=3).replace('\n', '\n   '))
+        f.write('\n]' if count else '[]')
+    return count
+
+
+def benchmark(copies=400, worker_counts=(1, 2, 4, 8)):
+    """
+    Clean `copies` copies of companies_final.json serially and with 1, 2, 4 and 8 worker processes,
+    check that every parallel output is byte-identical to the serial one and report the speedup
+    """
+    import filecmp
+    import os
+    import tempfile
+    import time
+    from college_index import load_index
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = list(read_records('companies_final.json'))
+        input_path = os.path.join(tmp, 'input.jsonl')
+        write_records((dict(company, rank=str(i)) for i in range(copies) for company in raw), input_path)
+        n = copies * len(raw)
+
+        serial_path = os.path.join(tmp, 'serial.json')
+        start = time.perf_counter()
+        write_records(clean_records(read_records(input_path), make_rules(load_colleges(), load_index())),
+                      serial_path)
+        serial = time.perf_counter() - start
+        print(f"serial:    {serial:.2f}s ({n / serial:,.0f} records/s)")
+
+        for workers in worker_counts:
+            parallel_path = os.path.join(tmp, f'parallel_{workers}.json')
+            start = time.perf_counter()
+            write_records(clean_records_parallel(read_records(input_path), workers), parallel_path)
+            elapsed = time.perf_counter() - start
+            identical = filecmp.cmp(serial_path, parallel_path, shallow=False)
+            print(f"{workers} workers: {elapsed:.2f}s, speedup {serial / elapsed:.2f}x, "
+                  f"{'identical' if identical else 'DIFFERENT'} output")
+        print(f"({os.cpu_count()} CPUs available)")
+
+
+if __name__ == "__main__":
+    benchmark()
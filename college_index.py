@@ -0,0 +1,142 @@
+# approximate lookup of universities in topcolleges.csv
+# names are normalized and split into trigrams, an inverted index trigram -> colleges finds the candidates
+# the index is pickled next to the csv and only rebuilt when the csv changes
+import csv
+import hashlib
+import os
+import pickle
+import re
+import time
+import unicodedata
+from collections import Counter
+
+INDEX_VERSION = 1
+
+# spelling variants that would otherwise cost similarity
+REPLACEMENTS = [(r'\bst\b', 'saint'), (r'\bmt\b', 'mount'), (r'\buniv\b', 'university'), (r'&', ' and ')]
+# words that don't help telling colleges apart ("University of X at Y" is "University X Y")
+STOPWORDS = {'the', 'of', 'at', 'in', 'and'}
+
+
+def normalize(name):
+    """
+    "Washington University in St. Louis" -> "louis saint university washington"
+    :param name: institution name
+    :return: lower case ascii tokens without punctuation and stopwords, sorted so that word order doesn't matter
+    """
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().lower()
+    for pattern, replacement in REPLACEMENTS:
+        name = re.sub(pattern, replacement, name)
+    tokens = [token for token in re.findall(r'[a-z0-9]+', name) if token not in STOPWORDS]
+    return " ".join(sorted(set(tokens)))
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CollegeIndex:
+    """
+    Trigram index over college names, lookup returns the most similar college (Dice coefficient
+    on trigram sets) if it is at least `threshold` similar
+    """
+    def __init__(self, rows, max_df=0.05):
+        """
+        :param rows: list of (name, state abbreviation)
+        :param max_df: trigrams found in more than this share of the names are too common to
+                       select candidates with (they still count for the similarity)
+        """
+        self.rows = rows
+        self.grams = [frozenset(trigrams(normalize(name))) for name, state in rows]
+        self.exact = {}
+        for i, (name, state) in enumerate(rows):
+            self.exact.setdefault(normalize(name), i)
+        df = Counter(gram for grams in self.grams for gram in grams)
+        cutoff = max(1, int(max_df * len(rows)))
+        self.postings = {}
+        for i, grams in enumerate(self.grams):
+            for gram in grams:
+                if df[gram] <= cutoff:
+                    self.postings.setdefault(gram, []).append(i)
+
+    def lookup(self, name, threshold=0.85):
+        """
+        :param name: institution name, in any spelling
+        :param threshold: minimum similarity between 0 and 1
+        :return: (college name, state abbreviation, similarity) or None
+        """
+        key = normalize(name)
+        if key in self.exact:
+            college, state = self.rows[self.exact[key]]
+            return college, state, 1.0
+        grams = trigrams(key)
+        candidates = Counter()
+        for gram in grams:
+            candidates.update(self.postings.get(gram, ()))
+        best, best_score = None, 0.0
+        for i, shared_rare in candidates.most_common(20):
+            score = 2 * len(grams & self.grams[i]) / (len(grams) + len(self.grams[i]))
+            if score > best_score:
+                best, best_score = i, score
+        if best is None or best_score < threshold:
+            return None
+        college, state = self.rows[best]
+        return college, state, best_score
+
+
+def _fingerprint(csv_path):
+    with open(csv_path, 'rb') as f:
+        return INDEX_VERSION, hashlib.sha256(f.read()).hexdigest()
+
+
+def load_index(csv_path='topcolleges.csv', index_path=None):
+    """
+    Load the pickled index, (re)building it if it is missing or was built from a different csv
+    :param csv_path: csv file with the columns Name and State
+    :param index_path: where the index is kept, next to the csv by default
+    :return: CollegeIndex
+    """
+    if index_path is None:
+        index_path = os.path.splitext(csv_path)[0] + '.idx'
+    fingerprint = _fingerprint(csv_path)
+    try:
+        with open(index_path, 'rb') as f:
+            stored_fingerprint, state = pickle.load(f)
+        if stored_fingerprint == fingerprint:
+            # only plain containers are pickled, so the file doesn't depend on how this module was imported
+            index = CollegeIndex.__new__(CollegeIndex)
+            index.__dict__.update(state)
+            return index
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        pass
+
+    with open(csv_path, 'r') as csvfile:
+        rows = [(row['Name'], row['State']) for row in csv.DictReader(csvfile, delimiter=',')]
+    index = CollegeIndex(rows)
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((fingerprint, vars(index)), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def benchmark():
+    """
+    Build/load times and lookup latency on misspelled variants of every college name
+    """
+    start = time.perf_counter()
+    index = load_index()
+    print(f"load: {(time.perf_counter() - start) * 1000:.1f} ms for {len(index.rows)} colleges")
+    queries = []
+    for name, state in index.rows:
+        queries.append(name.replace("University", "Univ.").replace(" of ", ", ") + " (Main Campus)")
+    start = time.perf_counter()
+    found = sum(1 for query, (name, state) in zip(queries, index.rows)
+                if (index.lookup(query, threshold=0.6) or (None,))[0] == name)
+    elapsed = time.perf_counter() - start
+    print(f"lookup: {elapsed / len(queries) * 1e6:.0f} us/query, {found}/{len(queries)} variants resolved")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,225 @@
+# columnar export of the snapshots of companies.db for analytics
+# every snapshot becomes a directory of .npy columns (one array per field), industry and state are
+# dictionary-encoded (small integer codes + the list of names); loading memory-maps the columns,
+# so NumPy code filters and aggregates millions of rows without copying them into Python objects
+# an export writes a new version directory (best-large-employers-2021.3/) and then replaces the pointer
+# file naming the current one (best-large-employers-2021.current) in one os.replace: readers always find
+# a complete snapshot, the previous version is kept for readers that still have it open
+# usage: python columnar.py [--db companies.db] [--out snapshots]
+#        python columnar.py --benchmark N   (aggregates on N synthetic rows: memory-mapped columns vs sqlite)
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+
+from companies_db import DB_FILE, DEFAULT_LIST, HISTOGRAM_BINS
+
+EXPORT_DIR = 'snapshots'
+FORMAT_VERSION = 1
+# stored for NULL in the integer columns (valid values are all >= 1)
+MISSING = -1
+# column -> dtype, industry and state hold codes into the dictionaries
+COLUMNS = {'entity_id': np.int64, 'rank': np.int32, 'employees': np.int64, 'year_founded': np.int32,
+           'industry': np.int16, 'state': np.int16}
+
+
+def snapshot_dir(list_name, year, directory=EXPORT_DIR):
+    """
+    :return: path of the current export of a snapshot, None if it was never exported
+    """
+    pointer = os.path.join(directory, f'{list_name}-{year}.current')
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, 'r') as f:
+        return os.path.join(directory, f.read().strip())
+
+
+def _versions(directory, base):
+    """
+    :return: sorted version numbers of the directories base.N
+    """
+    prefix = base + '.'
+    return sorted(int(name[len(prefix):]) for name in os.listdir(directory)
+                  if name.startswith(prefix) and name[len(prefix):].isdigit())
+
+
+def export_snapshot(conn, snapshot_id, directory=EXPORT_DIR):
+    """
+    Write one snapshot as columns, replacing an earlier export of it
+    :param conn: sqlite3 connection to companies.db
+    :param snapshot_id: id in Snapshots
+    :param directory: parent directory of the snapshot directories
+    :return: path of the new version directory of the snapshot
+    """
+    list_name, year = conn.execute('SELECT list, year FROM Snapshots WHERE id = ?', (snapshot_id, )).fetchone()
+    rows = conn.execute('''SELECT c.entity_id, c.rank, c.employees, c.year_founded, ind.industry, st.state
+                           FROM Companies AS c
+                           INNER JOIN Industries AS ind
+                           ON c.industry_id = ind.id
+                           INNER JOIN States AS st
+                           ON c.state_id = st.id
+                           WHERE c.snapshot_id = ?
+                           ORDER BY c.rank ASC''', (snapshot_id, )).fetchall()
+    # dictionary encoding: codes are positions in the sorted list of names
+    dictionaries = {'industry': sorted({row[4] for row in rows}), 'state': sorted({row[5] for row in rows})}
+    codes = {column: {name: code for code, name in enumerate(names)} for column, names in dictionaries.items()}
+
+    base = f'{list_name}-{year}'
+    os.makedirs(directory, exist_ok=True)
+    versions = _versions(directory, base)
+    name = f'{base}.{versions[-1] + 1 if versions else 1}'
+    path = os.path.join(directory, name)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for i, (column, dtype) in enumerate(COLUMNS.items()):
+        if column in codes:
+            values = [codes[column][row[i]] for row in rows]
+        else:
+            values = [MISSING if row[i] is None else row[i] for row in rows]
+        np.save(os.path.join(tmp_path, column + '.npy'), np.array(values, dtype=dtype))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'version': FORMAT_VERSION, 'list': list_name, 'year': year, 'rows': len(rows),
+                   'dictionaries': dictionaries}, f, indent=3)
+
+    # the new version is complete before the pointer names it, replacing the pointer is atomic
+    os.replace(tmp_path, path)
+    pointer = os.path.join(directory, base + '.current')
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(name)
+    os.replace(pointer + '.tmp', pointer)
+    # the version before stays for readers that loaded it just before the switch, older ones go
+    for version in versions[:-1]:
+        shutil.rmtree(os.path.join(directory, f'{base}.{version}'), ignore_errors=True)
+    return path
+
+
+def export_all(conn, directory=EXPORT_DIR):
+    """
+    :return: list of the paths written, one per snapshot
+    """
+    return [export_snapshot(conn, snapshot_id, directory)
+            for (snapshot_id, ) in conn.execute('SELECT id FROM Snapshots ORDER BY id').fetchall()]
+
+
+class ColumnarSnapshot:
+    """
+    A snapshot loaded from its directory: columns[name] is a read-only memory-mapped array,
+    dictionaries['industry'/'state'] the names behind the codes
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError(f"{path}: format version {meta['version']}, expected {FORMAT_VERSION}")
+        self.path = path
+        self.list = meta['list']
+        self.year = meta['year']
+        self.dictionaries = meta['dictionaries']
+        self.columns = {column: np.load(os.path.join(path, column + '.npy'), mmap_mode='r') for column in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns['rank'])
+
+    def count_by(self, column):
+        """
+        :param column: 'industry' or 'state'
+        :return: list of (name, number of companies) tuples, smallest count first (like QUERIES['count_by_...'])
+        """
+        counts = np.bincount(self.columns[column], minlength=len(self.dictionaries[column]))
+        order = np.argsort(counts, kind='stable')
+        return [(self.dictionaries[column][code], int(counts[code])) for code in order if counts[code] > 0]
+
+    def histogram(self, column):
+        """
+        Same result as companies_db.histogram, computed on the column
+        :param column: 'employees' or 'year_founded'
+        :return: (bin edges, count per bin, number of values shown, number of values)
+        """
+        values = self.columns[column]
+        values = values[values != MISSING]
+        if len(values) == 0:
+            return HISTOGRAM_BINS[column], [0] * (len(HISTOGRAM_BINS[column]) - 1), 0, 0
+        # removing outliers, > 2 deviations from the mean
+        shown = values[np.abs(values - values.mean()) < 2 * values.std()]
+        counts, edges = np.histogram(shown, bins=HISTOGRAM_BINS[column])
+        return HISTOGRAM_BINS[column], counts.tolist(), len(shown), len(values)
+
+
+def latest_path(list_name=DEFAULT_LIST, directory=EXPORT_DIR):
+    """
+    :return: path of the current export of the most recent exported year of the list, None if there is none
+    (cheap: reads one pointer file, to find out if a loaded snapshot is still the latest)
+    """
+    prefix, suffix = list_name + '-', '.current'
+    years = [int(name[len(prefix):-len(suffix)]) for name in os.listdir(directory)
+             if name.startswith(prefix) and name.endswith(suffix) and name[len(prefix):-len(suffix)].isdigit()] \
+        if os.path.isdir(directory) else []
+    if not years:
+        return None
+    return snapshot_dir(list_name, max(years), directory)
+
+
+def load_latest(list_name=DEFAULT_LIST, directory=EXPORT_DIR):
+    """
+    :return: ColumnarSnapshot of the most recent exported year of the list, None if there is none
+    """
+    path = latest_path(list_name, directory)
+    return ColumnarSnapshot(path) if path is not None else None
+
+
+def benchmark(n):
+    """
+    Trend aggregates on n synthetic companies: sqlite (what the GUI ran before the summary tables)
+    against memory-mapped columns
+    """
+    import importlib
+    import tempfile
+    loader = importlib.import_module('3_database')
+    from companies_db import QUERIES, create_schema
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = loader.connect(os.path.join(tmp, 'benchmark.db'))
+        create_schema(conn.cursor())
+        loader.load_bulk(conn, loader.synthetic_companies(n))
+        start = time.perf_counter()
+        path = export_all(conn, tmp)[0]
+        print(f"export: {n:,} rows in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        values = np.array([row[0] for row in conn.execute(QUERIES['employees'], (1, ))])
+        values = values[np.abs(values - values.mean()) < 2 * values.std()]
+        np.histogram(values, bins=HISTOGRAM_BINS['employees'])
+        conn.execute('''SELECT industry_id, COUNT(*) FROM Companies WHERE snapshot_id = 1 GROUP BY industry_id''').fetchall()
+        sqlite = time.perf_counter() - start
+        conn.close()
+
+        start = time.perf_counter()
+        snapshot = ColumnarSnapshot(path)
+        snapshot.histogram('employees')
+        snapshot.count_by('industry')
+        columnar = time.perf_counter() - start
+        print(f"histogram + counts per industry: sqlite {sqlite * 1000:.0f} ms, "
+              f"memory-mapped columns {columnar * 1000:.0f} ms ({sqlite / columnar:.0f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="export the snapshots of companies.db as .npy columns")
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--out', default=EXPORT_DIR)
+    parser.add_argument('--benchmark', type=int, metavar='N', help="time aggregates on N synthetic companies")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+    with sqlite3.connect(args.db) as conn:
+        for path in export_all(conn, args.out):
+            print(path)
+
+
+if __name__ == "__main__":
+    main()
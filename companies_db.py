@@ -0,0 +1,557 @@
+# schema of companies.db and the queries shared by the loader and the GUI
+# every list/year snapshot is stored side by side, companies are resolved to a stable entity across snapshots
+import bisect
+import math
+import re
+import sqlite3
+import unicodedata
+from urllib.parse import urlsplit
+
+DB_FILE = 'companies.db'
+DEFAULT_LIST = 'best-large-employers'
+DEFAULT_YEAR = 2021
+
+# bump when the layout changes, databases with another version are rebuilt by create_schema
+SCHEMA_VERSION = 7
+
+# indexes on Companies, kept apart so that a bulk load into an empty table can build them after the data
+# every query of the GUI is restricted to one snapshot, so snapshot_id leads every index;
+# the trailing columns make them covering for the queries in QUERIES (checked by check_query_plans)
+COMPANY_INDEXES = {
+    # company by rank, list of employers ordered by rank, biggest movers, deleting a snapshot
+    'Companies_snapshot_rank': 'Companies(snapshot_id, rank, name, entity_id)',
+    # companies of an industry/state (by rank, a page at a time), industries/states of a snapshot
+    'Companies_snapshot_industry': 'Companies(snapshot_id, industry_id, rank)',
+    'Companies_snapshot_state': 'Companies(snapshot_id, state_id, rank)',
+    # histograms
+    'Companies_snapshot_employees': 'Companies(snapshot_id, employees)',
+    'Companies_snapshot_founded': 'Companies(snapshot_id, year_founded)',
+    # natural key of a company row (an entity appears once per snapshot): incremental loading,
+    # rank history of an entity, biggest movers
+    'Companies_entity': 'Companies(entity_id, snapshot_id)',
+}
+UNIQUE_INDEXES = {'Companies_entity'}
+
+# full-text index over name and desc of Companies (external content, the text itself stays in Companies),
+# kept in sync by these triggers
+SEARCH_TRIGGERS = {
+    'Companies_search_insert': '''AFTER INSERT ON Companies BEGIN
+                                    INSERT INTO CompaniesSearch (rowid, name, desc) VALUES (new.id, new.name, new.desc);
+                                  END''',
+    'Companies_search_delete': '''AFTER DELETE ON Companies BEGIN
+                                    INSERT INTO CompaniesSearch (CompaniesSearch, rowid, name, desc)
+                                    VALUES ('delete', old.id, old.name, old.desc);
+                                  END''',
+    'Companies_search_update': '''AFTER UPDATE OF name, desc ON Companies BEGIN
+                                    INSERT INTO CompaniesSearch (CompaniesSearch, rowid, name, desc)
+                                    VALUES ('delete', old.id, old.name, old.desc);
+                                    INSERT INTO CompaniesSearch (rowid, name, desc) VALUES (new.id, new.name, new.desc);
+                                  END''',
+}
+
+
+def _count_triggers(dimension):
+    """
+    Triggers keeping {Dimension}Counts (companies per snapshot and industry/state) up to date
+    :param dimension: 'industry' or 'state'
+    :return: dict trigger name -> trigger definition
+    """
+    table, column = f'{dimension.capitalize()}Counts', f'{dimension}_id'
+    increment = f'''INSERT INTO {table} (snapshot_id, {column}, count) VALUES (new.snapshot_id, new.{column}, 1)
+                    ON CONFLICT (snapshot_id, {column}) DO UPDATE SET count = count + 1;'''
+    decrement = f'''UPDATE {table} SET count = count - 1 WHERE snapshot_id = old.snapshot_id AND {column} = old.{column};
+                    DELETE FROM {table} WHERE snapshot_id = old.snapshot_id AND {column} = old.{column} AND count = 0;'''
+    return {f'Companies_{dimension}_count_insert': f'AFTER INSERT ON Companies BEGIN {increment} END',
+            f'Companies_{dimension}_count_delete': f'AFTER DELETE ON Companies BEGIN {decrement} END',
+            f'Companies_{dimension}_count_update': f'AFTER UPDATE OF snapshot_id, {column} ON Companies '
+                                                   f'BEGIN {decrement} {increment} END'}
+
+
+# summary tables of the trend charts: companies per industry and per state, kept up to date by these triggers
+COUNT_TRIGGERS = {**_count_triggers('industry'), **_count_triggers('state')}
+
+# bins of the histograms of the trend charts
+HISTOGRAM_BINS = {
+    'employees': [0, 25000, 50000, 100000, 150000, 200000, 250000, 300000, 350000, 400000],
+    'year_founded': [1800, 1825, 1850, 1875, 1900, 1925, 1950, 1975, 2000, 2020],
+}
+
+# bm25 weights of name and desc: a hit in the name counts as much as ten in the description
+SEARCH_WEIGHTS = (10.0, 1.0)
+
+# legal-form words that don't tell companies apart ("PepsiCo, Inc." is "PepsiCo")
+NAME_STOPWORDS = {'the', 'inc', 'incorporated', 'corp', 'corporation', 'co', 'company', 'llc', 'ltd', 'limited',
+                  'plc', 'group', 'holding', 'holdings'}
+
+
+def create_schema(cur):
+    """
+    Create the tables if they don't exist yet, databases with an older layout are dropped and recreated
+    :param cur: sqlite3 cursor
+    :return: nothing
+    """
+    if cur.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        for table in ('CompaniesSearch', 'IndustryCounts', 'StateCounts', 'HistogramBins', 'Histograms', 'Companies',
+                      'EntityKeys', 'Entities', 'Snapshots', 'States', 'Industries'):
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS States(
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    state TEXT UNIQUE ON CONFLICT IGNORE)''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS Industries(
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    industry TEXT UNIQUE ON CONFLICT IGNORE)''')
+
+    # one row per list and year, e.g. ('best-large-employers', 2021)
+    cur.execute('''CREATE TABLE IF NOT EXISTS Snapshots(
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    list TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    UNIQUE (list, year))''')
+
+    # a company across all snapshots, found through any of its keys
+    # ('url:<profile slug>' or 'name:<normalized name>')
+    cur.execute('''CREATE TABLE IF NOT EXISTS Entities(
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    name TEXT)''')
+    cur.execute('''CREATE TABLE IF NOT EXISTS EntityKeys(
+                    key TEXT NOT NULL PRIMARY KEY,
+                    entity_id INTEGER NOT NULL REFERENCES Entities(id)) WITHOUT ROWID''')
+
+    cur.execute('''CREATE TABLE IF NOT EXISTS Companies(
+                    id INTEGER NOT NULL PRIMARY KEY UNIQUE,
+                    snapshot_id INTEGER NOT NULL REFERENCES Snapshots(id),
+                    entity_id INTEGER NOT NULL REFERENCES Entities(id),
+                    rank INTEGER,
+                    name TEXT,
+                    industry_id INTEGER REFERENCES Industries(id),
+                    state_id INTEGER REFERENCES States(id),
+                    employees INTEGER,
+                    year_founded INTEGER,
+                    desc TEXT,
+                    url TEXT)''')
+    create_indexes(cur)
+
+    cur.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS CompaniesSearch
+                   USING fts5(name, desc, content='Companies', content_rowid='id', tokenize='unicode61 remove_diacritics 2')''')
+
+    # summary tables of the trend charts, see COUNT_TRIGGERS and refresh_histograms
+    for table, column, dimension_table in (('IndustryCounts', 'industry_id', 'Industries'),
+                                           ('StateCounts', 'state_id', 'States')):
+        cur.execute(f'''CREATE TABLE IF NOT EXISTS {table}(
+                         snapshot_id INTEGER NOT NULL REFERENCES Snapshots(id),
+                         {column} INTEGER NOT NULL REFERENCES {dimension_table}(id),
+                         count INTEGER NOT NULL,
+                         PRIMARY KEY (snapshot_id, {column})) WITHOUT ROWID''')
+    # values counted per bin, without outliers (see refresh_histograms)
+    cur.execute('''CREATE TABLE IF NOT EXISTS HistogramBins(
+                    snapshot_id INTEGER NOT NULL REFERENCES Snapshots(id),
+                    field TEXT NOT NULL,
+                    bin INTEGER NOT NULL,
+                    low INTEGER NOT NULL,
+                    high INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (snapshot_id, field, bin)) WITHOUT ROWID''')
+    # number of values (total) and of values that aren't outliers (shown)
+    cur.execute('''CREATE TABLE IF NOT EXISTS Histograms(
+                    snapshot_id INTEGER NOT NULL REFERENCES Snapshots(id),
+                    field TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    shown INTEGER NOT NULL,
+                    PRIMARY KEY (snapshot_id, field)) WITHOUT ROWID''')
+    resume_sync(cur, rebuild=False)
+    cur.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+def create_indexes(cur):
+    for name, columns in COMPANY_INDEXES.items():
+        unique = 'UNIQUE ' if name in UNIQUE_INDEXES else ''
+        cur.execute(f'CREATE {unique}INDEX IF NOT EXISTS {name} ON {columns}')
+
+
+def drop_indexes(cur):
+    for name in COMPANY_INDEXES:
+        cur.execute(f'DROP INDEX IF EXISTS {name}')
+    # indexes of older layouts
+    for (name, ) in cur.execute('''SELECT name FROM sqlite_master
+                                   WHERE type = 'index' AND tbl_name = 'Companies' AND sql IS NOT NULL''').fetchall():
+        cur.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def suspend_sync(cur):
+    """
+    Drop the triggers keeping the full-text index and the per-industry/state counts in sync with Companies,
+    for bulk loads (see resume_sync)
+    """
+    for name in {**SEARCH_TRIGGERS, **COUNT_TRIGGERS}:
+        cur.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def resume_sync(cur, rebuild=True):
+    """
+    Create the triggers of the full-text index and of the per-industry/state counts
+    :param rebuild: rebuild the index and the counts from Companies, needed after suspend_sync
+    """
+    for name, body in {**SEARCH_TRIGGERS, **COUNT_TRIGGERS}.items():
+        cur.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+    if rebuild:
+        cur.execute("INSERT INTO CompaniesSearch (CompaniesSearch) VALUES ('rebuild')")
+        for dimension in ('industry', 'state'):
+            cur.execute(f'DELETE FROM {dimension.capitalize()}Counts')
+            cur.execute(f'''INSERT INTO {dimension.capitalize()}Counts (snapshot_id, {dimension}_id, count)
+                           SELECT snapshot_id, {dimension}_id, COUNT(*)
+                           FROM Companies
+                           GROUP BY snapshot_id, {dimension}_id''')
+
+
+def refresh_histograms(cur, snapshot_id):
+    """
+    Recompute the histograms of a snapshot: values further than 2 (population) standard deviations
+    from the mean are outliers and left out, the others are counted in HISTOGRAM_BINS like numpy.histogram
+    does (the last bin includes its upper edge, values outside of the bins aren't counted)
+    :param cur: sqlite3 cursor
+    :param snapshot_id: snapshot loaded or changed
+    :return: nothing
+    """
+    cur.execute('DELETE FROM HistogramBins WHERE snapshot_id = ?', (snapshot_id, ))
+    cur.execute('DELETE FROM Histograms WHERE snapshot_id = ?', (snapshot_id, ))
+    for field, bins in HISTOGRAM_BINS.items():
+        values = [value for (value, ) in cur.execute(QUERIES[field], (snapshot_id, ))]
+        shown = []
+        if values:
+            mean = sum(values) / len(values)
+            std = math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+            shown = [value for value in values if abs(value - mean) < 2 * std]
+        counts = [0] * (len(bins) - 1)
+        for value in shown:
+            if bins[0] <= value <= bins[-1]:
+                counts[min(bisect.bisect_right(bins, value) - 1, len(counts) - 1)] += 1
+        cur.executemany('INSERT INTO HistogramBins VALUES (?, ?, ?, ?, ?, ?)',
+                        [(snapshot_id, field, i, bins[i], bins[i + 1], count) for i, count in enumerate(counts)])
+        cur.execute('INSERT INTO Histograms VALUES (?, ?, ?, ?)', (snapshot_id, field, len(values), len(shown)))
+
+
+def histogram(cur, snapshot_id, field):
+    """
+    :param cur: sqlite3 cursor
+    :param snapshot_id: see latest_snapshot_id
+    :param field: 'employees' or 'year_founded'
+    :return: (bin edges, count per bin, number of values shown, number of values) as stored by refresh_histograms
+    """
+    rows = cur.execute(QUERIES['histogram_bins'], (snapshot_id, field)).fetchall()
+    totals = cur.execute(QUERIES['histogram_totals'], (snapshot_id, field)).fetchone() or (0, 0)
+    edges = [low for low, high, count in rows] + [rows[-1][1]] if rows else []
+    return edges, [count for low, high, count in rows], totals[1], totals[0]
+
+
+# QUERIES OF THE GUI
+# all parameterized by the snapshot id first
+_COMPANY_DETAILS = '''SELECT c.name, c.rank, ind.industry, st.state, c.year_founded, c.employees, c.desc, c.id
+                      FROM Companies AS c
+                      INNER JOIN States AS st
+                      ON c.state_id = st.id
+                      INNER JOIN Industries AS ind
+                      ON c.industry_id = ind.id
+                      WHERE c.snapshot_id = ?'''
+
+QUERIES = {
+    'company_by_rank': _COMPANY_DETAILS + ' AND c.rank = ?',
+    'search': _COMPANY_DETAILS.replace('FROM Companies AS c', '''FROM CompaniesSearch
+                      INNER JOIN Companies AS c
+                      ON c.id = CompaniesSearch.rowid''') + f'''
+                      AND CompaniesSearch MATCH ?
+                      ORDER BY bm25(CompaniesSearch, {SEARCH_WEIGHTS[0]}, {SEARCH_WEIGHTS[1]}) ASC
+                      LIMIT ?''',
+    'companies_by_industry': _COMPANY_DETAILS + ' AND ind.industry = ?',
+    'companies_by_state': _COMPANY_DETAILS + ' AND st.state = ?',
+    # keyset pagination by (rank, id), ranks can be missing or tied: the page after a (rank, id), the page
+    # before it (in descending order); companies without a rank (the comparison is NULL for them) come
+    # after the ranked ones, by id
+    'companies_by_industry_after': _COMPANY_DETAILS + '''
+        AND ind.industry = ? AND (c.rank, c.id) > (?, ?) ORDER BY c.rank ASC, c.id ASC LIMIT ?''',
+    'companies_by_industry_before': _COMPANY_DETAILS + '''
+        AND ind.industry = ? AND (c.rank, c.id) < (?, ?) ORDER BY c.rank DESC, c.id DESC LIMIT ?''',
+    'unranked_by_industry_after': _COMPANY_DETAILS + '''
+        AND ind.industry = ? AND c.rank IS NULL AND c.id > ? ORDER BY c.id ASC LIMIT ?''',
+    'unranked_by_industry_before': _COMPANY_DETAILS + '''
+        AND ind.industry = ? AND c.rank IS NULL AND c.id < ? ORDER BY c.id DESC LIMIT ?''',
+    'companies_by_state_after': _COMPANY_DETAILS + '''
+        AND st.state = ? AND (c.rank, c.id) > (?, ?) ORDER BY c.rank ASC, c.id ASC LIMIT ?''',
+    'companies_by_state_before': _COMPANY_DETAILS + '''
+        AND st.state = ? AND (c.rank, c.id) < (?, ?) ORDER BY c.rank DESC, c.id DESC LIMIT ?''',
+    'unranked_by_state_after': _COMPANY_DETAILS + '''
+        AND st.state = ? AND c.rank IS NULL AND c.id > ? ORDER BY c.id ASC LIMIT ?''',
+    'unranked_by_state_before': _COMPANY_DETAILS + '''
+        AND st.state = ? AND c.rank IS NULL AND c.id < ? ORDER BY c.id DESC LIMIT ?''',
+    # pages of a rank range: ranks up to end after a (rank, id)
+    'companies_by_rank_after': _COMPANY_DETAILS + '''
+        AND (c.rank, c.id) > (?, ?) AND c.rank <= ? ORDER BY c.rank ASC, c.id ASC LIMIT ?''',
+    'employees': '''SELECT employees
+                    FROM Companies
+                    WHERE snapshot_id = ? AND employees IS NOT NULL''',
+    'year_founded': '''SELECT year_founded
+                       FROM Companies
+                       WHERE snapshot_id = ? AND year_founded IS NOT NULL''',
+    # trend charts, from the summary tables
+    'count_by_industry': '''SELECT ind.industry, c.count
+                            FROM IndustryCounts AS c
+                            CROSS JOIN Industries AS ind
+                            ON c.industry_id = ind.id
+                            WHERE c.snapshot_id = ?
+                            ORDER BY c.count ASC''',
+    'count_by_state': '''SELECT st.state, c.count
+                         FROM StateCounts AS c
+                         CROSS JOIN States AS st
+                         ON c.state_id = st.id
+                         WHERE c.snapshot_id = ?
+                         ORDER BY c.count ASC''',
+    'histogram_bins': '''SELECT low, high, count
+                         FROM HistogramBins
+                         WHERE snapshot_id = ? AND field = ?
+                         ORDER BY bin ASC''',
+    'histogram_totals': '''SELECT total, shown
+                           FROM Histograms
+                           WHERE snapshot_id = ? AND field = ?''',
+    # CROSS JOIN keeps Companies as the outer loop (searched through the snapshot index) and the dimension
+    # tables as the inner one (searched by id), otherwise the planner may prefer scanning the small
+    # dimension tables once there are statistics
+    'states': '''SELECT DISTINCT st.state
+                 FROM Companies AS c
+                 CROSS JOIN States AS st
+                 ON c.state_id = st.id
+                 WHERE c.snapshot_id = ?
+                 ORDER BY st.state ASC''',
+    'industries': '''SELECT DISTINCT ind.industry
+                     FROM Companies AS c
+                     CROSS JOIN Industries AS ind
+                     ON c.industry_id = ind.id
+                     WHERE c.snapshot_id = ?
+                     ORDER BY ind.industry ASC''',
+    'employers': '''SELECT rank, name
+                    FROM Companies
+                    WHERE snapshot_id = ?
+                    ORDER BY rank ASC''',
+    'rank_history': '''SELECT s.list, s.year, c.rank
+                       FROM Companies AS c
+                       INNER JOIN Snapshots AS s
+                       ON c.snapshot_id = s.id
+                       WHERE c.entity_id = ?
+                       ORDER BY s.year ASC, s.list ASC''',
+    'biggest_movers': '''SELECT b.name, a.rank, b.rank, a.rank - b.rank AS gained
+                         FROM Companies AS a
+                         INNER JOIN Companies AS b
+                         ON b.entity_id = a.entity_id AND b.snapshot_id = ?
+                         WHERE a.snapshot_id = ?
+                         ORDER BY ABS(a.rank - b.rank) DESC, b.rank ASC
+                         LIMIT ?''',
+}
+
+
+def query_plan(cur, sql):
+    """
+    :param cur: sqlite3 cursor
+    :param sql: query with ? parameters
+    :return: list of the steps of EXPLAIN QUERY PLAN, e.g. "SEARCH c USING INDEX Companies_snapshot_rank (snapshot_id=?)"
+    """
+    parameters = [None] * sql.count('?')
+    return [row[-1] for row in cur.execute('EXPLAIN QUERY PLAN ' + sql, parameters)]
+
+
+# one row per list and year: once analyzed, the planner rightly scans it and searches the companies of
+# every snapshot through an index (e.g. rank_history) instead of looking each snapshot up
+SMALL_TABLES = {'Snapshots'}
+
+
+def check_query_plans(cur, queries=QUERIES):
+    """
+    Make sure no query reads a whole table: every step of every plan has to be an index search
+    (SCAN steps, i.e. full table or full index scans, are reported; lookups in the full-text index
+    are shown as "SCAN ... VIRTUAL TABLE INDEX" and scans of SMALL_TABLES are fine)
+    :param cur: sqlite3 cursor of a database created by create_schema
+    :param queries: dict name -> sql
+    :return: list of (query name, plan step) for the scans found, empty if all plans are fine
+    """
+    problems = []
+    for name, sql in queries.items():
+        # plan steps name the tables by their alias
+        small = SMALL_TABLES | {alias for table, alias in re.findall(r'(\w+) AS (\w+)', sql) if table in SMALL_TABLES}
+        for step in query_plan(cur, sql):
+            if step.startswith('SCAN') and step != 'SCAN CONSTANT ROW' and 'VIRTUAL TABLE INDEX' not in step \
+                    and step.split()[1] not in small:
+                problems.append((name, step))
+    return problems
+
+
+def normalize_name(name):
+    """
+    "The Home Depot, Inc." -> "home depot"
+    :param name: company name
+    :return: lower case name without accents, punctuation and legal-form words
+    """
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    tokens = re.findall(r'[a-z0-9]+', name.lower().replace('&', ' and '))
+    significant = [token for token in tokens if token not in NAME_STOPWORDS]
+    return " ".join(significant or tokens)
+
+
+def url_key(url):
+    """
+    :param url: profile url, e.g. https://www.forbes.com/companies/pepsico/
+    :return: last path segment ("pepsico") or None for a missing url
+    """
+    if not url or url == "-1":
+        return None
+    segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+    return segments[-1].lower() if segments else None
+
+
+def entity_keys(name, url):
+    keys = []
+    slug = url_key(url)
+    if slug:
+        keys.append('url:' + slug)
+    keys.append('name:' + normalize_name(name))
+    return keys
+
+
+def resolve_entity(cur, name, url):
+    """
+    Find the entity a company belongs to by profile url first and normalized name second,
+    creating it if neither is known; all keys of the company are recorded for the entity
+    so renamed companies and changed urls keep resolving to the same id
+    :param cur: sqlite3 cursor
+    :param name: company name
+    :param url: profile url
+    :return: entity id
+    """
+    keys = entity_keys(name, url)
+    entity_id = None
+    for key in keys:
+        row = cur.execute('SELECT entity_id FROM EntityKeys WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            entity_id = row[0]
+            break
+    if entity_id is None:
+        cur.execute('INSERT INTO Entities (name) VALUES (?)', (name,))
+        entity_id = cur.lastrowid
+    cur.executemany('INSERT OR IGNORE INTO EntityKeys (key, entity_id) VALUES (?, ?)',
+                    [(key, entity_id) for key in keys])
+    return entity_id
+
+
+def get_snapshot_id(cur, list_name, year, create=False):
+    """
+    :param cur: sqlite3 cursor
+    :param list_name: list name, e.g. 'best-large-employers'
+    :param year: year of the list
+    :param create: create the snapshot if it doesn't exist
+    :return: snapshot id or None
+    """
+    row = cur.execute('SELECT id FROM Snapshots WHERE list = ? AND year = ?', (list_name, year)).fetchone()
+    if row is not None:
+        return row[0]
+    if create:
+        cur.execute('INSERT INTO Snapshots (list, year) VALUES (?, ?)', (list_name, year))
+        return cur.lastrowid
+    return None
+
+
+def latest_snapshot_id(cur, list_name=DEFAULT_LIST):
+    """
+    :return: id of the most recent snapshot of the list, None if the list was never loaded
+    """
+    row = cur.execute('SELECT id FROM Snapshots WHERE list = ? ORDER BY year DESC LIMIT 1',
+                      (list_name,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def search_expression(text):
+    """
+    'health car' -> '"health"* "car"*': every word of the user's text has to occur (as a prefix, so
+    results show up while typing), characters with a meaning in the FTS5 query syntax are dropped
+    :param text: search text as typed
+    :return: FTS5 query, empty if there is no word in text
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+
+def search_companies(cur, snapshot_id, text, limit=50):
+    """
+    Full-text search over the names and descriptions of the companies of a snapshot, best match first (bm25)
+    :param cur: sqlite3 cursor
+    :param snapshot_id: see latest_snapshot_id
+    :param text: search text, see search_expression
+    :param limit: maximum number of results
+    :return: list of (name, rank, industry, state, year founded, employees, desc, id) tuples
+    """
+    expression = search_expression(text)
+    if not expression:
+        return []
+    return cur.execute(QUERIES['search'], (snapshot_id, expression, limit)).fetchall()
+
+
+def rank_history(cur, name, url=None):
+    """
+    Rank of a company in every snapshot it appears in
+    :param cur: sqlite3 cursor
+    :param name: company name (resolved through the normalized name)
+    :param url: profile url, optional
+    :return: list of (list, year, rank) tuples, oldest first
+    """
+    for key in entity_keys(name, url):
+        row = cur.execute('SELECT entity_id FROM EntityKeys WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            break
+    else:
+        return []
+    cur.execute(QUERIES['rank_history'], (row[0],))
+    return cur.fetchall()
+
+
+def biggest_movers(cur, year_from, year_to, list_name=DEFAULT_LIST, limit=10):
+    """
+    Companies whose rank changed the most between two years of a list
+    :param cur: sqlite3 cursor
+    :return: list of (name, rank in year_from, rank in year_to, places gained) tuples
+    """
+    old = get_snapshot_id(cur, list_name, year_from)
+    new = get_snapshot_id(cur, list_name, year_to)
+    if old is None or new is None:
+        return []
+    cur.execute(QUERIES['biggest_movers'], (new, old, limit))
+    return cur.fetchall()
+
+
+if __name__ == "__main__":
+    import sys
+    # python companies_db.py history "PepsiCo"
+    # python companies_db.py movers 2020 2021
+    # python companies_db.py plans
+    # python companies_db.py search "health care"
+    with sqlite3.connect(DB_FILE) as conn:
+        if sys.argv[1:2] == ['history']:
+            for row in rank_history(conn.cursor(), sys.argv[2]):
+                print(*row)
+        elif sys.argv[1:2] == ['movers']:
+            for row in biggest_movers(conn.cursor(), int(sys.argv[2]), int(sys.argv[3])):
+                print(*row)
+        elif sys.argv[1:2] == ['search']:
+            import time
+            cur = conn.cursor()
+            start = time.perf_counter()
+            rows = search_companies(cur, latest_snapshot_id(cur), " ".join(sys.argv[2:]))
+            elapsed = time.perf_counter() - start
+            for row in rows:
+                print(row[1], row[0])
+            print(f"{len(rows)} results in {elapsed * 1000:.1f} ms")
+        elif sys.argv[1:2] == ['plans']:
+            for name, sql in QUERIES.items():
+                print(name)
+                for step in query_plan(conn.cursor(), sql):
+                    print('   ', step)
+            problems = check_query_plans(conn.cursor())
+            print(f"{len(problems)} full scans" if problems else "no full scans")
+            sys.exit(1 if problems else 0)
+        else:
+            print("usage: companies_db.py history NAME | movers YEAR_FROM YEAR_TO | search TEXT | plans")
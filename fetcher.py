@@ -0,0 +1,167 @@
+# concurrent, rate-limited fetching of company profile pages
+# replaces the one-request-then-sleep(30) loop of 1_web.py
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+
+# statuses worth retrying: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket limiting how often requests may start,
+    `rate` tokens are added per second up to `burst` tokens
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and take it
+        :return: nothing
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Fetcher:
+    """
+    Fetches urls from a bounded thread pool, the request rate to any single host
+    never exceeds `rate_per_host` requests/second no matter how many workers are running
+    """
+    def __init__(self, max_workers=8, rate_per_host=0.5, burst=1, max_retries=4, backoff=2.0, timeout=30,
+                 cache=None):
+        self.max_workers = max_workers
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # optional http_cache.HttpCache, fresh entries skip the network, stale ones are revalidated
+        self.cache = cache
+        self._buckets = defaultdict(lambda: TokenBucket(self.rate_per_host, self.burst))
+        self._buckets_lock = threading.Lock()
+        # requests.Session is not thread safe, every worker thread gets its own
+        self._local = threading.local()
+
+    def _bucket(self, url):
+        with self._buckets_lock:
+            return self._buckets[urlsplit(url).netloc]
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _retry_delay(self, attempt, response=None):
+        """
+        Seconds to wait before the next attempt: Retry-After if the server sent one,
+        exponential backoff otherwise
+        """
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return int(retry_after)
+        return self.backoff * 2 ** attempt
+
+    def fetch(self, url):
+        """
+        Get one url, retrying with backoff on 429/5xx and connection errors
+        :param url: url to fetch
+        :return: requests.Response (the last one received if retries ran out)
+        :raises requests.RequestException: if no response could be received at all
+        """
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.get(url)
+            if entry is not None and self.cache.is_fresh(entry):
+                cached = self.cache.response(entry)
+                if cached is not None:
+                    return cached
+                entry = None
+            if self.cache.offline:
+                raise requests.ConnectionError(f"{url} is not in the cache (offline mode)")
+
+        bucket = self._bucket(url)
+        for attempt in range(self.max_retries + 1):
+            headers = self.cache.conditional_headers(entry) if entry is not None else {}
+            bucket.acquire()
+            try:
+                response = self._session().get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+            if response.status_code == 304 and entry is not None:
+                cached = self.cache.response(entry)
+                if cached is not None:
+                    self.cache.revalidated(entry)
+                    return cached
+                # the cached body is gone, ask again unconditionally
+                entry = None
+                continue
+            if response.status_code == 200 and self.cache is not None:
+                self.cache.store(url, response)
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            time.sleep(self._retry_delay(attempt, response))
+
+    def fetch_all(self, urls):
+        """
+        Fetch all urls concurrently
+        :param urls: iterable of urls
+        :return: generator of (url, response) pairs in order of completion,
+                 response is None if the url could not be fetched
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.fetch, url): url for url in urls}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except requests.RequestException:
+                    yield futures[future], None
+
+
+def demo(workers=8, rate=40.0, latency=0.1):
+    """
+    Fetch all fixture profile pages from a local stub server, sequentially and concurrently,
+    and check that the per-host rate ceiling was respected
+    """
+    from stub_forbes import StubForbes, load_companies
+
+    companies = load_companies()
+    with StubForbes(companies, fail_every=25, latency=latency) as stub:
+        urls = [stub.url_for(company) for company in companies]
+        for label, fetcher in (("sequential", Fetcher(max_workers=1, rate_per_host=rate, backoff=0.01)),
+                               (f"{workers} workers", Fetcher(max_workers=workers, rate_per_host=rate,
+                                                              backoff=0.01))):
+            stub.request_times.clear()
+            start = time.perf_counter()
+            ok = sum(1 for url, page in fetcher.fetch_all(urls) if page is not None and page.ok)
+            elapsed = time.perf_counter() - start
+            times = stub.request_times
+            observed = (len(times) - 1) / (times[-1] - times[0])
+            print(f"{label:>12}: {ok}/{len(urls)} pages in {elapsed:.1f}s, "
+                  f"{len(times)} requests, {observed:.1f} req/s (ceiling {rate} req/s)")
+
+
+if __name__ == "__main__":
+    demo()
@@ -0,0 +1,183 @@
+# on-disk HTTP response cache for the scraper
+# bodies are stored content-addressed (by sha256) in `bodies/`, the url index is a small sqlite db
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+
+class HttpCache:
+    """
+    Cache of GET responses keyed by url
+    - entries younger than `ttl` seconds are served without touching the network
+    - older entries are revalidated with If-None-Match / If-Modified-Since
+    - when the bodies take more than `max_bytes`, least recently used entries are evicted
+    - with `offline` set, only cached bodies are ever returned
+    """
+    def __init__(self, directory='.http_cache', ttl=7 * 24 * 3600, max_bytes=200 * 2 ** 20, offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(os.path.join(directory, 'bodies'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS Entries(
+                                url TEXT NOT NULL PRIMARY KEY,
+                                digest TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                etag TEXT,
+                                last_modified TEXT,
+                                content_type TEXT,
+                                fetched_at REAL NOT NULL,
+                                used_at REAL NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS Entries_used_at ON Entries(used_at)')
+        self._conn.commit()
+
+    def _body_path(self, digest):
+        return os.path.join(self.directory, 'bodies', digest)
+
+    def get(self, url):
+        """
+        :param url: url to look up
+        :return: index row of the cached entry (fresh or not) or None
+        """
+        with self._lock:
+            return self._conn.execute('SELECT * FROM Entries WHERE url = ?', (url,)).fetchone()
+
+    def is_fresh(self, entry):
+        return self.offline or time.time() - entry['fetched_at'] < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        :param entry: cached entry
+        :return: headers that turn a GET into a conditional GET for the entry
+        """
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def response(self, entry):
+        """
+        Rebuild a requests.Response from a cached entry and mark the entry as used
+        :param entry: cached entry
+        :return: requests.Response, or None if the body has gone missing
+        """
+        try:
+            with open(self._body_path(entry['digest']), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._conn.execute('UPDATE Entries SET used_at = ? WHERE url = ?', (time.time(), entry['url']))
+            self._conn.commit()
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry['url']
+        response._content = body
+        response.encoding = None
+        if entry['content_type']:
+            response.headers['Content-Type'] = entry['content_type']
+        if entry['etag']:
+            response.headers['ETag'] = entry['etag']
+        if entry['last_modified']:
+            response.headers['Last-Modified'] = entry['last_modified']
+        return response
+
+    def revalidated(self, entry):
+        """
+        The server answered 304 for the entry: it is fresh again
+        :param entry: cached entry
+        :return: nothing
+        """
+        with self._lock:
+            self._conn.execute('UPDATE Entries SET fetched_at = ? WHERE url = ?', (time.time(), entry['url']))
+            self._conn.commit()
+
+    def store(self, url, response):
+        """
+        Store a 200 response body under its sha256 and point the url at it
+        :param url: url the response was fetched from
+        :param response: requests.Response
+        :return: nothing
+        """
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._body_path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO Entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (url, digest, len(body), response.headers.get('ETag'),
+                                response.headers.get('Last-Modified'), response.headers.get('Content-Type'),
+                                now, now))
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        """
+        Drop least recently used entries until the unique bodies fit into max_bytes,
+        a body is deleted once no url points at it any more (caller holds the lock)
+        """
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM '
+                                   '(SELECT DISTINCT digest, size FROM Entries)').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, digest, size in self._conn.execute('SELECT url, digest, size FROM Entries '
+                                                    'ORDER BY used_at ASC').fetchall():
+            self._conn.execute('DELETE FROM Entries WHERE url = ?', (url,))
+            if self._conn.execute('SELECT 1 FROM Entries WHERE digest = ?', (digest,)).fetchone() is None:
+                try:
+                    os.remove(self._body_path(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size
+            if total <= self.max_bytes:
+                break
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def demo(directory='.http_cache_demo'):
+    """
+    Scrape the local stub server twice through a cache with ttl=0:
+    the second round is answered with 304s and served from disk
+    """
+    import shutil
+    from fetcher import Fetcher
+    from stub_forbes import StubForbes, load_companies
+
+    shutil.rmtree(directory, ignore_errors=True)
+    companies = load_companies()
+    with StubForbes(companies) as stub:
+        urls = [stub.url_for(company) for company in companies]
+        cache = HttpCache(directory, ttl=0)
+        for label in ("cold", "revalidate"):
+            stub.statuses.clear()
+            start = time.perf_counter()
+            pages = dict(Fetcher(max_workers=8, rate_per_host=200, cache=cache).fetch_all(urls))
+            elapsed = time.perf_counter() - start
+            print(f"{label:>10}: {len(pages)} pages in {elapsed:.2f}s, server answered {dict(stub.statuses)}")
+        cache.offline = True
+        pages = dict(Fetcher(cache=cache).fetch_all(urls))
+        print(f"   offline: {sum(page is not None for page in pages.values())} pages from disk")
+        cache.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    demo()
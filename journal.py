@@ -0,0 +1,97 @@
+# append-only JSONL journal of scraped company records
+# lets an interrupted scrape resume where it stopped instead of starting over
+import json
+import os
+import tempfile
+
+
+class Journal:
+    """
+    One JSON record per line, every line is flushed and fsync'ed as soon as it is written,
+    so a crash loses at most the record being written
+    """
+    def __init__(self, path):
+        self.path = path
+        self._records = []
+        self._recover()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _recover(self):
+        """
+        Load the records already in the journal and cut off a half-written last line if there is one
+        :return: nothing
+        """
+        if not os.path.exists(self.path):
+            return
+        good_size = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    self._records.append(json.loads(line))
+                except ValueError:
+                    break
+                good_size += len(line)
+        if good_size != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_size)
+
+    def records(self):
+        return list(self._records)
+
+    def completed(self, key='url'):
+        """
+        :param key: record field identifying a record
+        :return: set of key values already in the journal
+        """
+        return {record[key] for record in self._records}
+
+    def append(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._records.append(record)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def atomic_dump(data, path, **kwargs):
+    """
+    json.dump to a temporary file next to `path` and rename it over `path`,
+    so readers never see a partially written file
+    :return: nothing
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, **kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def compact(journal, path, order, key='url'):
+    """
+    Write the journaled records to `path` as one JSON list, atomically
+    :param journal: Journal object
+    :param path: output file
+    :param order: key values in the order the records should appear in the output
+    :param key: record field identifying a record
+    :return: number of records written
+    """
+    latest = {record[key]: record for record in journal.records()}
+    records = [latest[k] for k in order if k in latest]
+    atomic_dump(records, path, indent=3)
+    return len(records)
@@ -0,0 +1,138 @@
+# browser-free extraction of the "Best Large Employers" listing
+# parses the data table (or the JSON the table is built from) and all profile links in one pass
+import json
+import time
+
+from lxml import html
+
+TABLE_XPATH = '//*[@id="row-3"]/div/ul/li/div/div/table'
+# forbes appends the list name to every profile link
+LIST_SUFFIX = "?list=best-employers/"
+
+
+def clean_url(url):
+    return url.replace(LIST_SUFFIX, "")
+
+
+def parse_listing_html(payload, base_url='https://www.forbes.com'):
+    """
+    Extract the listing records from a rendered listing page in a single walk over the table rows
+    :param payload: html of the page (str or bytes), e.g. a saved page or Selenium's page_source
+    :param base_url: used to resolve relative links
+    :return: list of dicts with rank, name, industry, employees, year_founded and url
+    :raises ValueError: if the page does not contain the listing table or no company could be parsed from it
+    """
+    tree = html.fromstring(payload, base_url=base_url)
+    tables = tree.xpath(TABLE_XPATH) or tree.xpath('//table[.//td]')
+    if not tables:
+        raise ValueError("listing table not found")
+    tree.make_links_absolute(base_url)
+
+    companies_json = []
+    for row in tables[0].iter('tr'):
+        cols = row.findall('td')
+        if len(cols) < 5:  # skip the header row and rows of other tables found by the fallback xpath
+            continue
+        links = cols[1].xpath('.//a/@href')
+        companies_json.append({"rank": cols[0].text_content().strip(), "name": cols[1].text_content().strip(),
+                               "industry": cols[2].text_content().strip(),
+                               "employees": cols[3].text_content().strip(),
+                               "year_founded": cols[4].text_content().strip(),
+                               "url": clean_url(links[0]) if links else "-1"})
+    if not companies_json:
+        raise ValueError("no companies in the listing table")
+    return companies_json
+
+
+def _first(org, *keys):
+    for key in keys:
+        if org.get(key) not in (None, ""):
+            return org[key]
+    return None
+
+
+def parse_listing_json(payload):
+    """
+    Extract the listing records from the JSON the listing table is rendered from
+    (a list of organizations, possibly wrapped in {"organizationList": {"organizationsLists": [...]}})
+    :param payload: json text (str or bytes) or already decoded object
+    :return: list of dicts with rank, name, industry, employees, year_founded and url
+    :raises ValueError: if the payload does not look like a listing or lists no company
+    """
+    data = json.loads(payload) if isinstance(payload, (str, bytes)) else payload
+    if isinstance(data, dict):
+        data = data.get('organizationList', data)
+        data = data.get('organizationsLists', data.get('organizations'))
+    if not isinstance(data, list) or not data:
+        raise ValueError("no list of organizations in the payload")
+
+    companies_json = []
+    for org in data:
+        industry = _first(org, 'industry', 'industries')
+        if isinstance(industry, list):
+            industry = ", ".join(industry)
+        employees = _first(org, 'employees', 'numberOfEmployees')
+        url = _first(org, 'url', 'uri')
+        if url and not url.startswith('http'):
+            url = f"https://www.forbes.com/companies/{url.strip('/')}/"
+        companies_json.append({"rank": str(_first(org, 'rank', 'position')),
+                               "name": _first(org, 'name', 'organizationName'),
+                               "industry": industry if industry is not None else "-1",
+                               "employees": f"{employees:,}" if isinstance(employees, int) else str(employees or "-1"),
+                               "year_founded": str(_first(org, 'year_founded', 'yearFounded') or "-1"),
+                               "url": clean_url(url) if url else "-1"})
+    return companies_json
+
+
+def parse_listing(payload):
+    """
+    Parse a listing payload, JSON or html
+    :param payload: str or bytes
+    :return: list of listing records
+    :raises ValueError: if neither format can be parsed
+    """
+    text = payload.decode('utf-8', 'replace') if isinstance(payload, bytes) else payload
+    if text.lstrip()[:1] in ('{', '['):
+        return parse_listing_json(text)
+    return parse_listing_html(text)
+
+
+def demo(repeat=20):
+    """
+    Time the one-pass extraction against the per-row lookups of the old Selenium loop
+    (one XPath query per row for the links, as in find_elements_by_xpath(f'...tr[{i}]/td[2]/a')),
+    both run over the same fixture page so only the extraction strategy differs
+    """
+    import requests
+    from stub_forbes import StubForbes, load_companies
+
+    companies = load_companies()
+    with StubForbes(companies) as stub:
+        payload = requests.get(stub.base_url + '/best-large-employers/').content
+    expected = [{key: company[key] for key in ("rank", "name", "industry", "employees", "year_founded", "url")}
+                for company in companies]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        records = parse_listing(payload)
+    one_pass = (time.perf_counter() - start) / repeat
+    assert records == expected, "one-pass extraction does not match the fixture"
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        tree = html.fromstring(payload)
+        rows = tree.xpath(TABLE_XPATH)[0].findall('.//tr')
+        records = [[col.text_content() for col in row.findall('td')] for row in rows]
+        urls = []
+        for i in range(1, len(companies) + 1):
+            for elem in tree.xpath(f'{TABLE_XPATH}/tbody/tr[{i}]/td[2]/a'):
+                urls.append(elem.get("href"))
+    per_row = (time.perf_counter() - start) / repeat
+
+    print(f"one pass: {one_pass * 1000:.1f} ms, per-row lookups: {per_row * 1000:.1f} ms "
+          f"({per_row / one_pass:.0f}x) for {len(companies)} rows; "
+          f"the Selenium path adds a Chrome start and a driver round trip per row on top")
+
+
+if __name__ == "__main__":
+    demo()
@@ -0,0 +1,126 @@
+# load test of server.py: clients on threads, each on its own keep-alive connection, request the lists,
+# rank ranges, industries, locations and trends for a number of seconds, then requests per second and
+# latency percentiles are printed
+# a server is started on a free port unless --url is given
+# usage: python load_test.py [--url http://127.0.0.1:8000] [--clients 16] [--seconds 10] [--revalidate]
+import argparse
+import gzip
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from http.client import HTTPConnection
+from urllib.parse import quote, urlsplit
+
+
+def get(conn, path, headers=None):
+    """
+    :return: (status, decoded JSON or None, response headers)
+    """
+    conn.request('GET', path, headers=headers or {})
+    response = conn.getresponse()
+    body = response.read()
+    if response.getheader('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return response.status, json.loads(body) if body else None, response
+
+
+def request_paths(conn):
+    """
+    :return: list of paths, the operations of the GUI on every industry and location
+    """
+    industries = get(conn, '/industries')[1]['industries']
+    locations = get(conn, '/locations')[1]['locations']
+    paths = ['/trends/employees', '/trends/year-founded', '/trends/industry', '/trends/location']
+    paths += [f'/companies?ranks={start}-{start + 49}' for start in range(1, 500, 50)]
+    paths += [f'/companies?industry={quote(industry)}' for industry in industries]
+    paths += [f'/companies?location={quote(location)}' for location in locations]
+    return paths
+
+
+def client(host, port, paths, deadline, revalidate, latencies, statuses, lock):
+    conn = HTTPConnection(host, port)
+    etags = {}
+    mine = []
+    counts = Counter()
+    while time.perf_counter() < deadline:
+        path = random.choice(paths)
+        headers = {'Accept-Encoding': 'gzip'}
+        if revalidate and path in etags:
+            headers['If-None-Match'] = etags[path]
+        start = time.perf_counter()
+        status, data, response = get(conn, path, headers)
+        mine.append(time.perf_counter() - start)
+        counts[status] += 1
+        if response.getheader('ETag'):
+            etags[path] = response.getheader('ETag')
+    conn.close()
+    with lock:
+        latencies.extend(mine)
+        statuses.update(counts)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def start_server():
+    """
+    :return: (server process, port)
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([sys.executable, 'server.py', '--port', str(port)], stdout=subprocess.PIPE, text=True)
+    # the server prints its address once it listens
+    process.stdout.readline()
+    return process, port
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test of server.py")
+    parser.add_argument('--url', help="server to test, one is started if missing")
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--revalidate', action='store_true', help="send If-None-Match with the last ETag of a path")
+    args = parser.parse_args()
+
+    process = None
+    if args.url:
+        host, port = urlsplit(args.url).hostname, urlsplit(args.url).port or 80
+    else:
+        process, port = start_server()
+        host = '127.0.0.1'
+    try:
+        conn = HTTPConnection(host, port)
+        paths = request_paths(conn)
+        conn.close()
+        latencies, statuses, lock = [], Counter(), threading.Lock()
+        deadline = time.perf_counter() + args.seconds
+        threads = [threading.Thread(target=client, args=(host, port, paths, deadline, args.revalidate, latencies,
+                                                         statuses, lock)) for _ in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    latencies.sort()
+    print(f"{len(latencies):,} requests from {args.clients} clients in {elapsed:.1f}s: "
+          f"{len(latencies) / elapsed:,.0f} requests/s")
+    print(f"latency: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms, "
+          f"max {latencies[-1] * 1000:.1f} ms")
+    print("statuses:", ", ".join(f"{status}: {count:,}" for status, count in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    main()
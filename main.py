@@ -4,17 +4,80 @@
 
 import tkinter as tk
 import tkinter.messagebox as tkmb
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
-import sqlite3
-import numpy as np
+import base64
+import hashlib
+import io
+import os
+import sys
+import threading
 from textwrap import wrap
-from collections.abc import Iterable
+from collections import deque, OrderedDict
+from repository import Repository
+from tasks import TaskRunner
 
 
 COLOR_SCHEME = {'back': '#0D19A3', 'button': '#15DB95', 'button_text': '#0D19A3', 'font': 'white',
                 'button_pressed': 'springgreen4'}
 FONT = "Cambria"
+# where the trend charts get their data: "sqlite" (summary tables of companies.db) or "columnar"
+# (memory-mapped columns exported by columnar.py, falls back to sqlite if there is no export)
+TREND_BACKEND = os.environ.get("TREND_BACKEND", "sqlite")
+
+
+# companies fetched at once when scrolling through an industry or location
+PAGE_SIZE = 50
+# rendered trend charts (chart hash -> PNG) kept, see renderChart
+CHART_CACHE_SIZE = 8
+CHART_CACHE = OrderedDict()
+_chartLock = threading.Lock()
+# live Python objects a long session may gain after the warm-up, see chartMemoryCheck
+MEMORY_TOLERANCE = 500
+# matplotlib is imported on first use (it takes longer than building the whole menu), or in the background
+# once the main window is up, see loadPlotting
+WARM_UP_MS = 500
+_plotting = None
+_plottingLock = threading.Lock()
+
+
+def loadPlotting():
+    """
+    Import the plotting modules, once (can run on any thread)
+    :return: (Figure, FigureCanvasAgg) classes
+    """
+    global _plotting
+    with _plottingLock:
+        if _plotting is None:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            _plotting = (Figure, FigureCanvasAgg)
+        return _plotting
+
+
+def formatCompany(company):
+    """
+    Lines showing a company in a listbox
+    :param company: (name, rank, industry, state, year founded, employees, desc, ...)
+    :return: list of lines, the last one empty to separate companies
+    """
+    name, rank, industry, state, yearFounded, employees, desc = company[:7]
+    lines = ["Company: " + name,
+             "Rank: " + str(rank),
+             "Industry: " + industry,
+             "Location: " + state,
+             "Year Founded: " + (str(yearFounded) if yearFounded is not None else "None Provided"),
+             "Employees: " + (f"{employees:,}" if employees is not None else "None Provided")]
+    #split long description into lines of ~50 char (by whole words)
+    lines += wrap("Description: " + (desc if desc != "-1" else "None Provided"), 53)
+    lines.append("\n")
+    return lines
+
+
+def formatPage(page):
+    """
+    :param page: list of companies
+    :return: (page, lines showing its companies in a listbox)
+    """
+    return page, [line for company in page for line in formatCompany(company)]
 
 
 class MainWindow(tk.Tk):
@@ -31,9 +94,12 @@ class MainWindow(tk.Tk):
         self.title("")
         self.configure(bg=COLOR_SCHEME["back"])
 
-        # connect to the database
-        self._connection = sqlite3.connect("companies.db")
-        self._cur = self._connection.cursor()
+        # read-only connections to the database, everything shown is from the latest year of the list
+        self._repository = Repository()
+        # loaded (again) by getTrendData when the export changed
+        self._columnar = None
+        # queries and formatting run in the background, results come back through after() polling
+        self._tasks = TaskRunner(self, self._repository.pool, on_busy=self.setBusy)
 
         tk.Label(self, text="© Katerina Bosko, Patrick Salsbury. Data by Forbes", bg=COLOR_SCHEME["back"], font=(FONT, 10)).grid(
             sticky="nw")
@@ -43,33 +109,85 @@ class MainWindow(tk.Tk):
         tk.Button(frame, text="Display Top Employers by Rank", width=40, height=2, fg=COLOR_SCHEME["button_text"],
                   bg=COLOR_SCHEME["button"], activebackground=COLOR_SCHEME["button_pressed"],
                   activeforeground=COLOR_SCHEME["font"], font=(FONT, 15, "bold"),
-                  command=lambda: self.subWindow(NumDisplayWindow, "Display Top Employers by Rank",
-                                                 self.getEmployers())).grid(row=2, pady=5)
+                  command=lambda: self.runTask(self.getEmployers,
+                                               lambda data: self.subWindow(NumDisplayWindow,
+                                                                           "Display Top Employers by Rank", data))
+                  ).grid(row=2, pady=5)
         tk.Button(frame, text="Display by Industry", fg=COLOR_SCHEME["button_text"], width=40, height=2,
                   bg=COLOR_SCHEME["button"], activebackground=COLOR_SCHEME["button_pressed"],
                   activeforeground=COLOR_SCHEME["font"], font=(FONT, 15, "bold"),
-                  command=lambda: self.subWindow(DisplayListButtonWindow, "Display by Industry",
-                                                 self.getIndustries())).grid(row=3, pady=5)
+                  command=lambda: self.runTask(self.getIndustries,
+                                               lambda data: self.subWindow(DisplayListButtonWindow,
+                                                                           "Display by Industry", data))
+                  ).grid(row=3, pady=5)
         tk.Button(frame, text="Display by Location", fg=COLOR_SCHEME["button_text"], width=40, height=2,
                   bg=COLOR_SCHEME["button"], activebackground=COLOR_SCHEME["button_pressed"],
                   activeforeground=COLOR_SCHEME["font"], font=(FONT, 15, "bold"),
-                  command=lambda: self.subWindow(DisplayListButtonWindow, "Display by Location",
-                                                 self.getLocations())).grid(row=4, pady=5)
+                  command=lambda: self.runTask(self.getLocations,
+                                               lambda data: self.subWindow(DisplayListButtonWindow,
+                                                                           "Display by Location", data))
+                  ).grid(row=4, pady=5)
         tk.Button(frame, text="Display by Trends", fg=COLOR_SCHEME["button_text"], width=40, height=2,
                   bg=COLOR_SCHEME["button"], activebackground=COLOR_SCHEME["button_pressed"],
                   activeforeground=COLOR_SCHEME["font"], font=(FONT, 15, "bold"), command=self.byTrend).grid(row=5,
                                                                                                              pady=5)
+        # full-text search over names and descriptions
+        searchFrame = tk.Frame(frame, bg=COLOR_SCHEME["back"])
+        self.searchEntry = tk.Entry(searchFrame, width=28, font=(FONT, 15))
+        self.searchEntry.grid(row=0, column=0, padx=5)
+        self.searchEntry.bind("<Return>", lambda event: self.search())
+        tk.Button(searchFrame, text="Search", fg=COLOR_SCHEME["button_text"], bg=COLOR_SCHEME["button"],
+                  activebackground=COLOR_SCHEME["button_pressed"], activeforeground=COLOR_SCHEME["font"],
+                  font=(FONT, 15, "bold"), command=self.search).grid(row=0, column=1, padx=5)
+        searchFrame.grid(row=6, pady=20)
+        # shown while a query runs in the background
+        self.busyLabel = tk.Label(frame, text="", fg=COLOR_SCHEME["font"], bg=COLOR_SCHEME["back"], font=(FONT, 12))
+        self.busyLabel.grid(row=7)
         frame.grid(padx=200)
         self.protocol("WM_DELETE_WINDOW",self.windowClosing)
+        # matplotlib is loaded while the user looks at the menu, the first chart doesn't wait for it
+        self.after(WARM_UP_MS, lambda: threading.Thread(target=loadPlotting, name="warm-up", daemon=True).start())
 
     def windowClosing(self):
         """
-        Protocol for when the MainWindow is closed
+        Protocol for when the MainWindow is closed, running queries are interrupted
         :return: nothing
         """
-        self._connection.close()
+        self._tasks.shutdown()
+        self._repository.close()
         self.destroy()
 
+    def runTask(self, work, onDone, onError=None):
+        """
+        Run work (queries, formatting - no Tk calls) on a worker thread and onDone(result) on the Tk thread
+        :param work: function without arguments
+        :param onDone: function taking the result of work
+        :param onError: function taking the exception, called on the Tk thread after the error is shown
+        :return: the task, see tasks.TaskRunner
+        """
+        def failed(error):
+            self.taskFailed(error)
+            if onError is not None:
+                onError(error)
+        return self._tasks.submit(work, onDone, failed)
+
+    def taskFailed(self, error):
+        """
+        Handles a query or formatting error of a background task
+        :param error: the exception
+        :return: nothing
+        """
+        tkmb.showerror("Error", str(error), parent=self)
+
+    def setBusy(self, busy):
+        """
+        Show or hide the busy indicator
+        :param busy: whether a background task is running
+        :return: nothing
+        """
+        self.busyLabel.configure(text="Loading..." if busy else "")
+        self.configure(cursor="watch" if busy else "")
+
     def subWindow(self, windowClass, title, displayList):
         """
         Handles the functionality when one of the MainWindow buttons have been pressed by creating a
@@ -83,46 +201,59 @@ class MainWindow(tk.Tk):
         self.wait_window(window)
         if window.isConfirmed():
             if type(window) == NumDisplayWindow:
-                self._cur.execute("""
-                    SELECT c.name, c.rank, ind.industry, st.state, c.year_founded, c.employees, c.desc
-                    FROM Companies AS c
-                    INNER JOIN States AS st
-                    ON c.state_id = st.id
-                    INNER JOIN Industries AS ind
-                    ON c.industry_id = ind.id
-                    WHERE rank = ?""",
-                    (window.getSelection()[0],))
+                rank = window.getSelection()[0]
+                # the formatted list is cached with the query results, until the database changes
+                self.runTask(lambda: self._repository.cached(("rank window", rank), lambda: self.getDataForSubWin(
+                                 self._repository.company_by_rank(rank), window, title)),
+                             lambda result: self.showCompanies(result, lambda: DisplayListWindow(self, *result)))
 
             elif type(window) == DisplayListButtonWindow:  # could be by location or industry
-                windowType = title.split()[-1].strip()
-                if windowType == "Industry":
-                    self._cur.execute("""
-                        SELECT c.name, c.rank, ind.industry, st.state, c.year_founded, c.employees, c.desc
-                        FROM Companies AS c
-                        INNER JOIN States AS st
-                        ON c.state_id = st.id
-                        INNER JOIN Industries AS ind
-                        ON c.industry_id = ind.id
-                        WHERE industry = ?""",
-                        (window.getSelection(),))
-
-                elif windowType == "Location":
-                    self._cur.execute("""
-                        SELECT c.name, c.rank, ind.industry, st.state, c.year_founded, c.employees, c.desc
-                        FROM Companies AS c
-                        INNER JOIN States AS st
-                        ON c.state_id = st.id
-                        INNER JOIN Industries AS ind
-                        ON c.industry_id = ind.id
-                        WHERE state = ?""",
-                        (window.getSelection(),))
-
-            data = self._cur.fetchall()
-            displayTitle, dataList = self.getDataForSubWin(data, window, title)
-
-            DisplayListWindow(self, displayTitle, dataList)
+                # industries and states can hold many companies, they are shown a page at a time
+                field = "industry" if title.split()[-1].strip() == "Industry" else "state"
+                selection = window.getSelection()
+
+                def fetchPage(after=None, before=None):
+                    return self._repository.companies_page(field, selection, after, before, PAGE_SIZE)
+
+                self.runTask(lambda: formatPage(fetchPage()), lambda firstPage: self.showCompanies(
+                    firstPage[0], lambda: PagedListWindow(
+                        self, self.getDisplayTitle(firstPage[0][0], window, title), fetchPage, firstPage)))
+
+    def showCompanies(self, result, openWindow):
+        """
+        Opens the window showing the result of a query, or tells that there is nothing to show
+        (e.g. the selection was made before the database was reloaded)
+        :param result: the companies or the formatted result, empty or None if nothing was found
+        :param openWindow: function creating the window
+        :return: nothing
+        """
+        if not result:
+            tkmb.showinfo("No companies", "No companies found, the data may have changed", parent=self)
+            return
+        openWindow()
 
 
+    def search(self):
+        """
+        Handles the functionality of when the search button is pressed (or Return in the search box) by showing
+        the companies matching the text in a DisplayListWindow, best matches first
+        :return: nothing
+        """
+        text = self.searchEntry.get().strip()
+        if len(text) == 0:
+            return
+        def formatResults():
+            data = self._repository.search(text)
+            return self.getDataForSubWin(data, None, "Search")[1] if len(data) != 0 else []
+
+        def showResults(dataList):
+            if len(dataList) == 0:
+                tkmb.showinfo("Search", f'No companies found for "{text}"', parent=self)
+                return
+            DisplayListWindow(self, f'Results for "{text}"', dataList)
+
+        self.runTask(lambda: self._repository.cached(("search window", text), formatResults), showResults)
+
     def getDataForSubWin(self, data, window, title):
         """
         Get the appropriate formated data depending on which sub window is created and display using
@@ -130,60 +261,39 @@ class MainWindow(tk.Tk):
         :param data: the data needed to format
         :param window: the subclass window created
         :param title: title of window to create
-        :return: nothing
+        :return: (window title, lines to display), None if data is empty
         """
-        # changing format to a list of lists
-        # bc tuple is immutable (self._cur.fetchall() output is list of tuples)
-        dataList = [[*elem, "\n"] for elem in data]
+        if len(data) == 0:
+            return None
+        return (self.getDisplayTitle(data[0], window, title), [line for company in data for line in formatCompany(company)])
 
+    def getDisplayTitle(self, company, window, title):
+        """
+        Title of the window showing companies
+        :param company: first company shown
+        :param window: the subclass window created
+        :param title: title of window to create
+        :return: title
+        """
         # window depth 3: title based on type of industry or location
         displayTitle = "Companies in "
         if type(window) == NumDisplayWindow:
-            displayTitle = dataList[0][0]
+            displayTitle = company[0]
         elif type(window) == DisplayListButtonWindow:  # could be by location or industry
             windowType = title.split()[-1].strip()
             if windowType == "Industry":
                 # making the long titles fit better on the screen
-                title_splitted = dataList[0][2].split(",")
+                title_splitted = company[2].split(",")
                 if len(title_splitted) > 2:
                     title_splitted = ", ".join(title_splitted[:2]) + ",\n" + ", ".join(title_splitted[2:])
                 elif len(title_splitted) == 2:
                     title_splitted = ", ".join(title_splitted[:1]) + ",\n" + ", ".join(title_splitted[1:])
                 else:
-                    title_splitted = dataList[0][2]
+                    title_splitted = company[2]
                 displayTitle += title_splitted
             elif windowType == "Location":
-                displayTitle += dataList[0][3]
-
-        # adding information to a company (a list)
-        for company in dataList:
-            company[0] = "Company: " + company[0]
-            company[1] = "Rank: " + str(company[1])
-            company[2] = "Industry: " + company[2]
-            company[3] = "Location: " + company[3]
-            company[4] = "Year Founded: " + str(company[4])
-            company[5] = "Employees: " +str(company[5])
-            if company[6] != "-1":
-                company[6] = "Description: " + company[6]
-            else:
-                company[6] = "Description: None Provided"
-
-            #split long description into lines of ~50 char (by whole words),
-            # produces a list
-            company[6] = wrap(company[6], 53)
-
-        # flatten the list of lists for correct display
-        dataList = [elem for tuple in dataList for elem in tuple]
-
-        # flatten again bc dataList is a list of irregular lists like ["abc", "def", "efg", ["hij", "klm"]]
-        flatten_dataList = []
-        for elem in dataList:
-            if isinstance(elem, Iterable) and not isinstance(elem, str):
-                for el in elem:
-                    flatten_dataList.append(el)
-            else:
-                flatten_dataList.append(elem)
-        return (displayTitle, flatten_dataList)
+                displayTitle += company[3]
+        return displayTitle
 
     # Plotting
     def byTrend(self):
@@ -197,32 +307,42 @@ class MainWindow(tk.Tk):
         self.wait_window(trendWin)
         if trendWin.isConfirmed():
             choice = trendWin.getSelection()
+            # data and chart are both made in the background, the Tk thread only shows the image
+            self.runTask(lambda: renderChart(self.getTrendData(choice), choice), lambda png: PlotWindow(self, png))
+
+    def getTrendData(self, choice):
+        """
+        Get the data of a trend chart, from the columnar export if it is the backend, from the summary
+        tables maintained by 3_database.py otherwise
+        :param choice: which type of plot (see RadioButtonWindow)
+        :return: data for PlotWindow.makePlot
+        """
+        if TREND_BACKEND == "columnar":
+            from columnar import ColumnarSnapshot, latest_path
+            # 3_database.py exports a new version after every load
+            path = latest_path()
+            if path is None:
+                self._columnar = None
+            elif self._columnar is None or self._columnar.path != path:
+                self._columnar = ColumnarSnapshot(path)
+        if self._columnar is not None:
             if choice == 1:
-                self._cur.execute("""
-                                    SELECT employees
-                                    FROM Companies""")
-
+                return self._columnar.histogram('employees')
             elif choice == 2:
-                self._cur.execute("""SELECT year_founded
-                                    FROM Companies""")
+                return self._columnar.histogram('year_founded')
             elif choice == 3:
-                self._cur.execute("""SELECT ind.industry, COUNT(c.industry_id)
-                                    FROM Companies AS c
-                                    INNER JOIN Industries AS ind
-                                    ON c.industry_id = ind.id
-                                    GROUP BY ind.industry
-                                    ORDER BY COUNT(c.industry_id) ASC
-                                    """)
-
+                return self._columnar.count_by('industry')
             elif choice == 4:
-                self._cur.execute("""SELECT state, COUNT(state)
-                                     FROM Companies
-                                     INNER JOIN States
-                                     ON Companies.state_id = States.id
-                                     GROUP BY state
-                                     ORDER BY COUNT(state) ASC""")
-            data = self._cur.fetchall()
-            PlotWindow(self,data,choice)
+                return self._columnar.count_by('state')
+
+        if choice == 1:
+            return self._repository.histogram('employees')
+        elif choice == 2:
+            return self._repository.histogram('year_founded')
+        elif choice == 3:
+            return self._repository.count_by_industry()
+        elif choice == 4:
+            return self._repository.count_by_state()
 
 
 
@@ -231,32 +351,21 @@ class MainWindow(tk.Tk):
         Get all locations from database
         :return: list of employer locations
         """
-        self._cur.execute("""
-                        SELECT state
-                        FROM States
-                        ORDER BY state ASC""")
-        return [state for tuple in self._cur.fetchall() for state in tuple]
+        return self._repository.states()
 
     def getIndustries(self):
         """
         Get all industries from database
         :return: list of employer industries
         """
-        self._cur.execute("""
-                        SELECT industry
-                        FROM Industries
-                        ORDER BY industry ASC""")
-        return [industry for tuple in self._cur.fetchall() for industry in tuple]
+        return self._repository.industries()
 
     def getEmployers(self):
         """
         Get all Employers from database
         :return: list of Employers
         """
-        self._cur.execute("""SELECT rank, name
-                            FROM Companies
-                            ORDER BY rank ASC""")
-        return self._cur.fetchall()
+        return self._repository.employers()
 
 
 class DisplayListWindow(tk.Toplevel):
@@ -277,18 +386,120 @@ class DisplayListWindow(tk.Toplevel):
         tk.Label(self, text=title, fg=COLOR_SCHEME["font"], bg=COLOR_SCHEME["back"],
                  font=(FONT, 25, "bold")).grid(pady=30, padx=100)
         self.frame = tk.Frame(self, bg=COLOR_SCHEME["back"])
-        scrollBar = tk.Scrollbar(self.frame, orient="vertical")
+        self.scrollBar = tk.Scrollbar(self.frame, orient="vertical")
         self.listBox = tk.Listbox(self.frame, width=40, height=15, font=(FONT, 15),
-                                  listvariable=tk.StringVar(value=displayList), yscrollcommand=scrollBar.set)
+                                  listvariable=tk.StringVar(value=displayList), yscrollcommand=self.scrollBar.set)
         self.listBox.grid(row=1, column=0)
-        scrollBar.config(command=self.listBox.yview)
-        scrollBar.grid(row=1, column=1, sticky="ns")
+        self.scrollBar.config(command=self.listBox.yview)
+        self.scrollBar.grid(row=1, column=1, sticky="ns")
         self.frame.grid(padx=100)
 
     def getListboxSelection(self):
         return self.listBox.curselection()
 
 
+class PagedListWindow(DisplayListWindow):
+    """
+    Definition of PagedListWindow, a DisplayListWindow for long lists of companies: pages of companies are
+    fetched and formatted (on a worker thread) only when the user scrolls close to them, and at most maxPages
+    pages are kept in the listbox (pages scrolled far away are dropped and fetched again when needed)
+    """
+    def __init__(self, masterwin, title, fetchPage, firstPage, pageSize=PAGE_SIZE, maxPages=3):
+        """
+        Default constructor
+        :param masterwin: the MainWindow, its runTask fetches the pages in the background
+        :param title: title to display
+        :param fetchPage: function(after=None, before=None) returning the page of companies after/before
+                          a (rank, id), see Repository.companies_page
+        :param firstPage: first page of companies and its lines (already fetched, see formatPage)
+        :param pageSize: number of companies per page
+        :param maxPages: number of pages kept in the listbox
+        """
+        super().__init__(masterwin, title, [])
+        self.runTask = masterwin.runTask
+        self.fetchPage = fetchPage
+        self.pageSize = pageSize
+        self.maxPages = maxPages
+        # pages in the listbox: ((rank, id) of the first company, (rank, id) of the last company, number of lines)
+        self.pages = deque()
+        self.atStart = True
+        self.atEnd = len(firstPage[0]) < pageSize
+        # set while a page is fetched, until its lines are in the listbox
+        self.loading = False
+        self.listBox.configure(yscrollcommand=self.onScroll)
+        self.appendPage(firstPage)
+
+    def onScroll(self, first, last):
+        """
+        Handles the scrolling of the listbox, fetching the next/previous page close to either end
+        :param first: fraction of the lines above the visible part
+        :param last: fraction of the lines up to the end of the visible part
+        :return: nothing
+        """
+        self.scrollBar.set(first, last)
+        if self.loading:
+            return
+        if float(last) > 0.9 and not self.atEnd:
+            self.loading = True
+            after = self.pages[-1][1]
+            self.runTask(lambda: formatPage(self.fetchPage(after=after)), self.showNext, self.loadFailed)
+        elif float(first) < 0.1 and not self.atStart:
+            self.loading = True
+            before = self.pages[0][0]
+            self.runTask(lambda: formatPage(self.fetchPage(before=before)), self.showPrevious, self.loadFailed)
+
+    def appendPage(self, formatted):
+        page, lines = formatted
+        self.listBox.insert(tk.END, *lines)
+        self.pages.append(((page[0].rank, page[0].id), (page[-1].rank, page[-1].id), len(lines)))
+
+    def showNext(self, formatted):
+        """
+        Adds the page fetched after the last one (called on the Tk thread)
+        :param formatted: (page, lines), see formatPage
+        :return: nothing
+        """
+        if not self.winfo_exists():
+            return
+        page, lines = formatted
+        self.atEnd = len(page) < self.pageSize
+        if len(page) != 0:
+            self.appendPage(formatted)
+        if len(self.pages) > self.maxPages:
+            # drop the first page, keeping the visible lines in place
+            first, last, lineCount = self.pages.popleft()
+            top = self.listBox.nearest(0)
+            self.listBox.delete(0, lineCount - 1)
+            self.listBox.yview(max(top - lineCount, 0))
+            self.atStart = False
+        self.loading = False
+
+    def showPrevious(self, formatted):
+        """
+        Adds the page fetched before the first one (called on the Tk thread)
+        :param formatted: (page, lines), see formatPage
+        :return: nothing
+        """
+        if not self.winfo_exists():
+            return
+        page, lines = formatted
+        self.atStart = len(page) < self.pageSize
+        if len(page) != 0:
+            top = self.listBox.nearest(0)
+            self.listBox.insert(0, *lines)
+            self.pages.appendleft(((page[0].rank, page[0].id), (page[-1].rank, page[-1].id), len(lines)))
+            self.listBox.yview(top + len(lines))
+        if len(self.pages) > self.maxPages:
+            first, last, lineCount = self.pages.pop()
+            self.listBox.delete(self.listBox.size() - lineCount, tk.END)
+            self.atEnd = False
+        self.loading = False
+
+    def loadFailed(self, error):
+        # scrolling tries again
+        self.loading = False
+
+
 class DisplayListButtonWindow(DisplayListWindow):
     """
     Defintion of DisplayListButtonWindow that inherits everything from DisplayListWindow but adds the
@@ -440,113 +651,206 @@ class PlotWindow(tk.Toplevel):
     """
     Definiton of PlotWindow class which will be used to plot multiple different trends
     """
-    def __init__(self, masterwin,data,choice):
+    def __init__(self, masterwin, png):
         """
         Default constructor
         :param masterwin: master window object
-        :param data: list of tuples that will be used to display
-        :param choice: which type of plot to use
+        :param png: the chart, rendered by renderChart
         """
         super().__init__(masterwin)
         self.resizable(False,False)
-        self.fig = plt.figure(figsize=(10, 8))
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self)
-        self.canvas.get_tk_widget().grid()
-        self.makePlot(data, choice)
-        self.canvas.draw()
+        # the figure itself is gone already, the window only holds the image
+        self.image = tk.PhotoImage(master=self, data=base64.b64encode(png))
+        tk.Label(self, image=self.image).grid()
 
+    def destroy(self):
+        super().destroy()
+        # Tk keeps an image until it is deleted explicitly
+        if self.image is not None:
+            self.tk.call("image", "delete", self.image.name)
+            self.image = None
 
-    def makePlot(self, data, choice):
-        """
-        Configure the plot before displaying it
-        :param data: list of tuples that will be used to display
-        :param choice: which type of plot to use
-        :return: nothing
-        """
-        if choice == 1:
-            numEmployees = [int(str(elem[0]).replace(',', '')) for elem in data]
-            numEmployees_np = np.array(numEmployees)
-
-            # removing outliers, > 2 deviations from the mean
-            distance_from_mean = abs(numEmployees_np - numEmployees_np.mean())
-            not_outlier = distance_from_mean < 2 * numEmployees_np.std()
-            no_outliers = numEmployees_np[not_outlier]
-            ax = self.fig.add_subplot()
-            bins = [0, 25000, 50000, 100000, 150000, 200000, 250000, 300000, 350000, 400000]
-            plt.hist(no_outliers, bins=bins, density=False, edgecolor="black", color="lightskyblue")
-            plt.title("Distribution by Number of Employees", fontsize=16, fontweight="bold")
-            plt.xlabel("Number of Employees")
-            plt.ylabel("Number of Companies")
-            # print values for each bin
-            for rect in ax.patches:
-                height = rect.get_height()
-                ax.annotate(f'{int(height)}', xy=(rect.get_x()+rect.get_width()/2, height),
-                            xytext=(0, 2), textcoords='offset points', ha='center', va='bottom')
-            plt.text(0.63,0.95, f"Note: Data without outliers.", transform=ax.transAxes, color='grey', fontsize=8)
-            plt.text(0.63,0.92, f"{len(no_outliers)} out of 500 companies shown.", transform=ax.transAxes, color='grey', fontsize=8)
-            plt.tight_layout()
-
-        elif choice == 2:
-            years = [int(elem[0]) for elem in data]
-            years_np = np.array(years)
-
-            # removing outliers, > 2 deviations from the mean
-            distance_from_mean = abs(years_np - years_np.mean())
-            not_outlier = distance_from_mean < 2 * years_np.std()
-
-            no_outliers = years_np[not_outlier]
-            ax = self.fig.add_subplot()
-            bins = [1800, 1825, 1850, 1875, 1900, 1925, 1950, 1975, 2000, 2020]
-            ax.hist(no_outliers, bins=bins, density=False, edgecolor="black", color="lightskyblue")
-            plt.title("Distribution by Year Founded", fontsize=16, fontweight="bold")
-            plt.xlabel("Years Founded")
-            plt.ylabel("Number of Companies")
-            # print values for each bin
-            for rect in ax.patches:
-                height = rect.get_height()
-                ax.annotate(f'{int(height)}', xy=(rect.get_x()+rect.get_width()/2, height),
-                            xytext=(0, 2), textcoords='offset points', ha='center', va='bottom')
-
-            plt.text(0.03,0.95, f"Note: Data without outliers.", transform=ax.transAxes, color='grey', fontsize=8)
-            plt.text(0.03,0.92, f"{len(no_outliers)} out of 500 companies shown.", transform=ax.transAxes, color='grey', fontsize=8)
-
-        elif choice == 3:
-            industry_names = [elem[0] for elem in data]
-            industry_num = [elem[1] for elem in data]
-            industry_names_short = []
-            for industry in industry_names:
-                if len(industry.split(", ")) > 2:
-                    industry = ", ".join(industry.split(", ")[0:2]) + "\n" + ", ".join(industry.split(", ")[2:4])
-                industry_names_short.append(industry)
-
-            ax = self.fig.add_subplot()
-            ax.barh(industry_names_short, industry_num, edgecolor="black", color="lightskyblue")
-            # print values for each bar
-            for i, v in enumerate(industry_num):
-                ax.text(v + .25, i - 0.2, str(v), fontsize=6)
-            plt.title("Companies by Industry", fontsize=16, fontweight="bold")
-            plt.xlabel("Number of Companies")
-            plt.yticks(fontsize=6)
-            plt.tight_layout()
 
-        elif choice == 4:
+def chartKey(data, choice):
+    """
+    :return: hash of the input of a chart
+    """
+    return hashlib.sha256(repr((choice, data)).encode()).hexdigest()
 
-            state = [elem[0] for elem in data]
-            numPerState = [elem[1] for elem in data]
-            ax = self.fig.add_subplot()
-            ax.barh(state, numPerState, edgecolor="black", color="lightskyblue")
-            # print values for each bar
-            for i, v in enumerate(numPerState):
-                ax.text(v + .25, i - 0.2, str(v), fontsize=6)
 
-            plt.title("Companies by Location", fontsize=16, fontweight="bold")
-            plt.ylabel("Location")
-            plt.xlabel("Number of Companies")
-            plt.tight_layout()
+def renderChart(data, choice):
+    """
+    PNG of a trend chart, served from CHART_CACHE when the data did not change since it was last drawn.
+    The figure is a matplotlib.figure.Figure (not registered with pyplot), released once it is rendered.
+    Tk is not used: can run on a worker thread
+    :param data: see makePlot
+    :param choice: which type of plot to use
+    :return: PNG bytes
+    """
+    key = chartKey(data, choice)
+    with _chartLock:
+        if key in CHART_CACHE:
+            CHART_CACHE.move_to_end(key)
+            return CHART_CACHE[key]
+        Figure, FigureCanvasAgg = loadPlotting()
+        fig = Figure(figsize=(10, 8))
+        FigureCanvasAgg(fig)
+        makePlot(fig, data, choice)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png")
+        fig.clear()
+        png = buffer.getvalue()
+        CHART_CACHE[key] = png
+        while len(CHART_CACHE) > CHART_CACHE_SIZE:
+            CHART_CACHE.popitem(last=False)
+        return png
+
+
+def makePlot(fig, data, choice):
+    """
+    Configure the plot before displaying it
+    :param fig: the Figure to draw on
+    :param data: (bin edges, counts, number shown, number of companies) for the histograms (choice 1 and 2),
+                 list of (name, count) tuples otherwise
+    :param choice: which type of plot to use
+    :return: nothing
+    """
+    if choice == 1:
+        # bins are counted without outliers (> 2 deviations from the mean) by the loader
+        bins, counts, shown, total = data
+        ax = fig.add_subplot()
+        # one value per bin weighted by its count draws the same bars as the raw values
+        ax.hist(bins[:-1], bins=bins, weights=counts, density=False, edgecolor="black", color="lightskyblue")
+        ax.set_title("Distribution by Number of Employees", fontsize=16, fontweight="bold")
+        ax.set_xlabel("Number of Employees")
+        ax.set_ylabel("Number of Companies")
+        # print values for each bin
+        for rect in ax.patches:
+            height = rect.get_height()
+            ax.annotate(f'{int(height)}', xy=(rect.get_x()+rect.get_width()/2, height),
+                        xytext=(0, 2), textcoords='offset points', ha='center', va='bottom')
+        ax.text(0.63,0.95, f"Note: Data without outliers.", transform=ax.transAxes, color='grey', fontsize=8)
+        ax.text(0.63,0.92, f"{shown} out of {total} companies shown.", transform=ax.transAxes, color='grey', fontsize=8)
+        fig.tight_layout()
+
+    elif choice == 2:
+        bins, counts, shown, total = data
+        ax = fig.add_subplot()
+        ax.hist(bins[:-1], bins=bins, weights=counts, density=False, edgecolor="black", color="lightskyblue")
+        ax.set_title("Distribution by Year Founded", fontsize=16, fontweight="bold")
+        ax.set_xlabel("Years Founded")
+        ax.set_ylabel("Number of Companies")
+        # print values for each bin
+        for rect in ax.patches:
+            height = rect.get_height()
+            ax.annotate(f'{int(height)}', xy=(rect.get_x()+rect.get_width()/2, height),
+                        xytext=(0, 2), textcoords='offset points', ha='center', va='bottom')
+
+        ax.text(0.03,0.95, f"Note: Data without outliers.", transform=ax.transAxes, color='grey', fontsize=8)
+        ax.text(0.03,0.92, f"{shown} out of {total} companies shown.", transform=ax.transAxes, color='grey', fontsize=8)
+
+    elif choice == 3:
+        industry_names = [elem[0] for elem in data]
+        industry_num = [elem[1] for elem in data]
+        industry_names_short = []
+        for industry in industry_names:
+            if len(industry.split(", ")) > 2:
+                industry = ", ".join(industry.split(", ")[0:2]) + "\n" + ", ".join(industry.split(", ")[2:4])
+            industry_names_short.append(industry)
+
+        ax = fig.add_subplot()
+        ax.barh(industry_names_short, industry_num, edgecolor="black", color="lightskyblue")
+        # print values for each bar
+        for i, v in enumerate(industry_num):
+            ax.text(v + .25, i - 0.2, str(v), fontsize=6)
+        ax.set_title("Companies by Industry", fontsize=16, fontweight="bold")
+        ax.set_xlabel("Number of Companies")
+        ax.tick_params(axis="y", labelsize=6)
+        fig.tight_layout()
+
+    elif choice == 4:
+
+        state = [elem[0] for elem in data]
+        numPerState = [elem[1] for elem in data]
+        ax = fig.add_subplot()
+        ax.barh(state, numPerState, edgecolor="black", color="lightskyblue")
+        # print values for each bar
+        for i, v in enumerate(numPerState):
+            ax.text(v + .25, i - 0.2, str(v), fontsize=6)
+
+        ax.set_title("Companies by Location", fontsize=16, fontweight="bold")
+        ax.set_ylabel("Location")
+        ax.set_xlabel("Number of Companies")
+        fig.tight_layout()
+
+
+def chartCycles(data, openings, root=None, every=50, redrawn=None):
+    """
+    Open (and close) the trend charts again and again, the live Python objects and Figures are counted
+    every `every` openings
+    :param data: dict choice -> data of the chart (see makePlot)
+    :param openings: number of charts opened
+    :param root: Tk root the PlotWindows are opened in, None to only render the charts
+    :param every: openings between two counts
+    :param redrawn: number of first openings bypassing the chart cache, half of them by default
+    :return: list of (charts opened, live objects, live Figures, ms per chart)
+    """
+    import gc
+    import time
+    redrawn = openings // 2 if redrawn is None else redrawn
+    samples = []
+    start = time.perf_counter()
+    for i in range(openings):
+        if i < redrawn:
+            CHART_CACHE.clear()
+        png = renderChart(data[i % len(data) + 1], i % len(data) + 1)
+        if root is not None:
+            PlotWindow(root, png).destroy()
+            root.update()
+        if (i + 1) % every == 0:
+            elapsed = time.perf_counter() - start
+            gc.collect()
+            objects = gc.get_objects()
+            figures = sum(1 for o in objects if isinstance(o, loadPlotting()[0]))
+            samples.append((i + 1, len(objects), figures, elapsed / every * 1000))
+            del objects
+            start = time.perf_counter()
+    return samples
+
+
+def chartMemoryCheck(openings=400):
+    """
+    Long session: open (and close) the trend charts again and again, bypassing the chart cache for one
+    half of the run, and print the number of live Python objects and Figures every 50 openings, which
+    should stay flat. Real windows are opened if there is a display
+    :param openings: number of charts opened
+    :return: True if no Figure is left and the object count stayed flat
+    """
+    repository = Repository()
+    data = {1: repository.histogram('employees'), 2: repository.histogram('year_founded'),
+            3: repository.count_by_industry(), 4: repository.count_by_state()}
+    repository.close()
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        root = None
+        print("no display: rendering only")
+
+    samples = chartCycles(data, openings, root)
+    for opened, objects, figures, ms in samples:
+        print(f"{opened} charts ({'redrawn' if opened <= openings // 2 else 'cached'}): {objects:,} live objects, "
+              f"{figures} figures, {ms:.1f} ms per chart")
+    if root is not None:
+        root.destroy()
+    # the first count is after the warm-up (imports, font cache, ...)
+    growth = samples[-1][1] - samples[0][1]
+    return samples[-1][2] == 0 and growth <= MEMORY_TOLERANCE
 
 
 #main
 if __name__ == "__main__":
+    if "--memory-check" in sys.argv:
+        sys.exit(0 if chartMemoryCheck() else 1)
     run = MainWindow()
     run.mainloop()
     run.quit()
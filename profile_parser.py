@@ -0,0 +1,109 @@
+# fast extraction of headquarters and description from a company profile page
+# compiled lxml XPath first, the original BeautifulSoup lookups when the fast path misses
+import os
+import time
+
+from bs4 import BeautifulSoup
+from lxml import etree, html
+
+# first span after the "Headquarters" label, same as soup.find(string="Headquarters").findNext('span')
+HEADQUARTERS_XPATH = etree.XPath('(//text()[.="Headquarters"]/following::span)[1]')
+# first span after the opening tag of div.profile-text, same as soup.find('div', class_=...).findNext('span')
+PROFILE_TEXT_DIV = '//div[contains(concat(" ", normalize-space(@class), " "), " profile-text ")]'
+DESC_XPATH = etree.XPath(f'({PROFILE_TEXT_DIV}//span | {PROFILE_TEXT_DIV}/following::span)[1]')
+
+_parser = html.HTMLParser(remove_comments=True)
+
+
+def parse_profile_fast(content):
+    """
+    :param content: page html (bytes or str)
+    :return: (headquarters, desc), None for a field that wasn't found
+    """
+    if not content:
+        return None, None
+    tree = html.fromstring(content, parser=_parser)
+    headquarters = desc = None
+    spans = HEADQUARTERS_XPATH(tree)
+    if spans:
+        # .contents[0] in the BeautifulSoup version: the text before the first child element
+        headquarters = spans[0].text if spans[0].text is not None else None
+    spans = DESC_XPATH(tree)
+    if spans:
+        desc = spans[0].text_content()
+    return headquarters, desc
+
+
+def parse_profile_soup(content):
+    """
+    The original BeautifulSoup lookups of 1_web.py
+    :param content: page html (bytes or str)
+    :return: (headquarters, desc), None for a field that wasn't found
+    """
+    soup = BeautifulSoup(content or "", "lxml")
+    try:
+        headquarters = soup.find(string="Headquarters").findNext('span').contents[0]
+    except:
+        headquarters = None
+    try:
+        desc = soup.find('div', class_="profile-text").findNext('span').text
+    except:
+        desc = None
+    return headquarters, desc
+
+
+def parse_profile(content):
+    """
+    Extract headquarters and description, missing fields are encoded as "-1"
+    :param content: page html (bytes or str)
+    :return: (headquarters, desc)
+    """
+    try:
+        headquarters, desc = parse_profile_fast(content)
+    except (etree.ParserError, ValueError):
+        headquarters = desc = None
+    if headquarters is None or desc is None:
+        soup_headquarters, soup_desc = parse_profile_soup(content)
+        headquarters = headquarters if headquarters is not None else soup_headquarters
+        desc = desc if desc is not None else soup_desc
+    return (str(headquarters) if headquarters is not None else "-1",
+            str(desc) if desc is not None else "-1")
+
+
+def load_corpus(directory=None):
+    """
+    :param directory: directory of saved profile pages (*.html), the stub fixture pages if None
+    :return: list of page contents (bytes)
+    """
+    if directory is None:
+        from stub_forbes import load_companies, render_profile
+        return [render_profile(company).encode() for company in load_companies()]
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.html'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                corpus.append(f.read())
+    return corpus
+
+
+def benchmark(directory=None, repeat=3):
+    """
+    Micro-benchmark: BeautifulSoup vs compiled XPath over a corpus of saved profile pages,
+    also checks that both give the same fields on every page
+    """
+    corpus = load_corpus(directory)
+    for page in corpus:
+        assert parse_profile(page) == tuple(v if v is not None else "-1" for v in parse_profile_soup(page)), \
+            "fast path disagrees with BeautifulSoup"
+    for label, parse in (("BeautifulSoup", parse_profile_soup), ("lxml XPath", parse_profile)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for page in corpus:
+                parse(page)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{label:>14}: {elapsed / len(corpus) * 1000:.2f} ms/page over {len(corpus)} pages")
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
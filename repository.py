@@ -0,0 +1,357 @@
+# data access of the GUI: typed query methods over a small pool of read-only connections to companies.db
+# every method borrows a connection for the duration of one query, so methods can be called from worker
+# threads concurrently; statements are prepared once per connection (sqlite3's statement cache, the SQL
+# strings are the constants of companies_db.QUERIES) and every query is timed in one place;
+# results are kept in an LRU cache that is emptied as soon as another connection commits to the database
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from companies_db import DB_FILE, DEFAULT_LIST, QUERIES, histogram, latest_snapshot_id, search_companies
+
+
+class Company(NamedTuple):
+    name: str
+    rank: Optional[int]
+    industry: str
+    state: str
+    year_founded: Optional[int]
+    employees: Optional[int]
+    desc: str
+    # Companies.id, orders companies of the same rank in pages
+    id: Optional[int] = None
+
+
+class Employer(NamedTuple):
+    rank: Optional[int]
+    name: str
+
+
+class Histogram(NamedTuple):
+    bins: list
+    counts: list
+    shown: int
+    total: int
+
+
+# (rank, id) cursors before the first and after the last ranked company
+_FIRST = (-2 ** 63, 0)
+_PAST_LAST = (2 ** 63 - 1, 0)
+
+
+class ConnectionPool:
+    """
+    Fixed number of read-only connections (URI mode=ro, the GUI can't modify the database by accident),
+    handed out to one thread at a time
+    """
+    def __init__(self, path=DB_FILE, size=4):
+        """
+        :param path: sqlite database
+        :param size: number of connections, i.e. of queries that can run at the same time
+        """
+        self._idle = queue.Queue()
+        self._all = []
+        for _ in range(size):
+            # check_same_thread=False: a connection moves between threads, but is never used by two at once
+            conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False,
+                                   cached_statements=2 * len(QUERIES))
+            self._all.append(conn)
+            self._idle.put(conn)
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection, waits if all of them are in use
+        """
+        conn = self._idle.get()
+        with self._lock:
+            self._busy.add(conn)
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._busy.discard(conn)
+            self._idle.put(conn)
+
+    def interrupt(self):
+        """
+        Abort the queries running right now (they raise sqlite3.OperationalError)
+        """
+        with self._lock:
+            for conn in self._busy:
+                conn.interrupt()
+
+    def close(self):
+        for conn in self._all:
+            conn.close()
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of query results (and anything derived from them, e.g. formatted lists), keyed by
+    query and parameters. It is emptied when the database changes: PRAGMA data_version of a connection
+    changes whenever another connection commits, it is checked on every lookup (no table is read for it)
+    """
+    def __init__(self, path=DB_FILE, maxsize=256, on_change=None):
+        """
+        :param path: sqlite database
+        :param maxsize: number of results kept, the least recently used ones are dropped first
+        :param on_change: function without arguments called (under the lock, before the lookup) when the
+                          database changed, e.g. to find the latest snapshot again
+        """
+        self.maxsize = maxsize
+        self.on_change = on_change
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # only used under the lock
+        self._watch = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        self._version = self._data_version()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _data_version(self):
+        return self._watch.execute('PRAGMA data_version').fetchone()[0]
+
+    def get(self, key, compute):
+        """
+        :param key: hashable, e.g. (query name, parameters)
+        :param compute: function without arguments computing the value on a miss (run outside the lock,
+                        so misses of different threads run concurrently)
+        :return: cached or computed value, shared between callers: don't modify it
+        """
+        with self._lock:
+            version = self._data_version()
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+                self.invalidations += 1
+                if self.on_change is not None:
+                    self.on_change()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            # not kept if the database changed while computing
+            if self._version == version:
+                self._entries[key] = value
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        return f"cache: {self.hits} hits, {self.misses} misses, {self.invalidations} invalidations, " \
+               f"{len(self._entries)}/{self.maxsize} entries"
+
+    def close(self):
+        self._watch.close()
+
+
+class Repository:
+    """
+    The queries of the GUI, on the latest snapshot of a list (found again whenever the database changes,
+    e.g. 3_database.py loaded a new year)
+    """
+    def __init__(self, path=DB_FILE, pool_size=4, list_name=DEFAULT_LIST, cache_size=256):
+        self.list_name = list_name
+        self.pool = ConnectionPool(path, pool_size)
+        self._find_snapshot()
+        self.cache = ResultCache(path, cache_size, self._find_snapshot)
+        # query name -> [number of calls, total seconds]
+        self.timings = {}
+        self._timings_lock = threading.Lock()
+
+    def _find_snapshot(self):
+        # queries already running finish on the snapshot they started with
+        with self.pool.connection() as conn:
+            self.snapshot = latest_snapshot_id(conn.cursor(), self.list_name)
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._timings_lock:
+                timing = self.timings.setdefault(name, [0, 0.0])
+                timing[0] += 1
+                timing[1] += elapsed
+
+    def _fetch(self, name, *parameters):
+        def query():
+            with self._timed(name), self.pool.connection() as conn:
+                return conn.execute(QUERIES[name], (self.snapshot, *parameters)).fetchall()
+        return self.cached((name, parameters), query)
+
+    def cached(self, key, compute):
+        """
+        Cache something derived from the latest snapshot (e.g. a formatted list) until the database changes
+        :param key: hashable, distinct from the query keys (query name, parameters)
+        :param compute: function without arguments
+        :return: value of compute, don't modify it
+        """
+        # the lookup may find a new snapshot, compute reads self.snapshot again when it runs
+        return self.cache.get((self.snapshot, key), compute)
+
+    def company_by_rank(self, rank):
+        """
+        :return: list of Company (one, or none if no company has this rank)
+        """
+        return [Company(*row) for row in self._fetch('company_by_rank', rank)]
+
+    def companies_by_industry(self, industry):
+        return [Company(*row) for row in self._fetch('companies_by_industry', industry)]
+
+    def companies_by_state(self, state):
+        return [Company(*row) for row in self._fetch('companies_by_state', state)]
+
+    def companies_page(self, field, value, after=None, before=None, limit=50):
+        """
+        One page of the companies of an industry or state, by rank then id, companies without a rank last
+        (keyset pagination: the page is found through the index from the (rank, id) it starts at, no OFFSET)
+        :param field: 'industry' or 'state'
+        :param value: industry or state name
+        :param after: (rank, id) of a company, page of the companies after it (the first page if after and
+                      before are None)
+        :param before: (rank, id) of a company, page of the companies just before it
+        :param limit: page size
+        :return: list of Company, in page order
+        """
+        if before is not None:
+            rank, company_id = before
+            rows = []
+            if rank is None:
+                rows = self._fetch(f'unranked_by_{field}_before', value, company_id, limit)
+                rank, company_id = _PAST_LAST
+            if len(rows) < limit:
+                rows = rows + self._fetch(f'companies_by_{field}_before', value, rank, company_id, limit - len(rows))
+            return [Company(*row) for row in reversed(rows)]
+        rank, company_id = _FIRST if after is None else after
+        rows = []
+        if rank is not None:
+            rows = self._fetch(f'companies_by_{field}_after', value, rank, company_id, limit)
+            company_id = 0
+        if len(rows) < limit:
+            rows = rows + self._fetch(f'unranked_by_{field}_after', value, company_id, limit - len(rows))
+        return [Company(*row) for row in rows]
+
+    def companies_by_rank(self, start, end, after=None, limit=50):
+        """
+        One page of the companies ranked start to end (keyset pagination like companies_page)
+        :param start: first rank of the range
+        :param end: last rank of the range
+        :param after: (rank, id) of a company, page of the companies of the range after it (the first page if None)
+        :param limit: page size
+        :return: list of Company, by rank then id
+        """
+        if after is not None and after[0] is None:
+            # unranked companies are past every range
+            return []
+        rank, company_id = (start, 0) if after is None else max(after, (start, 0))
+        return [Company(*row) for row in self._fetch('companies_by_rank_after', rank, company_id, end, limit)]
+
+    def employers(self):
+        """
+        :return: list of Employer, by rank
+        """
+        return [Employer(*row) for row in self._fetch('employers')]
+
+    def industries(self):
+        """
+        :return: list of the industries of the snapshot, alphabetically
+        """
+        return [industry for (industry, ) in self._fetch('industries')]
+
+    def states(self):
+        """
+        :return: list of the states of the snapshot, alphabetically
+        """
+        return [state for (state, ) in self._fetch('states')]
+
+    def count_by_industry(self):
+        """
+        :return: list of (industry, number of companies) tuples, smallest first
+        """
+        return self._fetch('count_by_industry')
+
+    def count_by_state(self):
+        """
+        :return: list of (state, number of companies) tuples, smallest first
+        """
+        return self._fetch('count_by_state')
+
+    def histogram(self, field):
+        """
+        :param field: 'employees' or 'year_founded'
+        :return: Histogram, see companies_db.histogram
+        """
+        def query():
+            with self._timed('histogram'), self.pool.connection() as conn:
+                return Histogram(*histogram(conn.cursor(), self.snapshot, field))
+        return self.cached(('histogram', field), query)
+
+    def search(self, text, limit=50):
+        """
+        :return: list of Company, best match first, see companies_db.search_companies
+        """
+        def query():
+            with self._timed('search'), self.pool.connection() as conn:
+                return [Company(*row) for row in search_companies(conn.cursor(), self.snapshot, text, limit)]
+        return self.cached(('search', text, limit), query)
+
+    def report(self):
+        """
+        :return: lines "query: calls, total and mean time" (queries that ran, not those served from the cache),
+                 slowest total first, then the cache counters
+        """
+        with self._timings_lock:
+            timings = sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True)
+        return [f"{name}: {calls} calls, {total * 1000:.1f} ms total, {total / calls * 1000:.2f} ms mean"
+                for name, (calls, total) in timings] + [self.cache.stats()]
+
+    def close(self):
+        self.cache.close()
+        self.pool.close()
+
+
+def benchmark(threads=4, repeat=200, cache_size=256):
+    """
+    Run the list and detail queries of the GUI from several threads at once, then the same navigation
+    without the cache (cache_size 0)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    if cache_size:
+        benchmark(threads, repeat, 0)
+    repository = Repository(pool_size=threads, cache_size=cache_size)
+    industries = repository.industries()
+    states = repository.states()
+
+    def work(i):
+        repository.employers()
+        repository.companies_by_industry(industries[i % len(industries)])
+        repository.companies_by_state(states[i % len(states)])
+        repository.company_by_rank(i % 500 + 1)
+        repository.count_by_state()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(work, range(repeat)))
+    elapsed = time.perf_counter() - start
+    print(f"{repeat * 5} queries on {threads} threads in {elapsed:.2f}s, cache of {cache_size} results")
+    for line in repository.report():
+        print("   ", line)
+    repository.close()
+
+
+if __name__ == "__main__":
+    benchmark()
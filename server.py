@@ -0,0 +1,216 @@
+# local HTTP/JSON service with the queries of the GUI, on the latest snapshot of companies.db
+# requests are served on threads (ThreadingHTTPServer) through repository.Repository: a pool of read-only
+# connections and the result cache; lists of companies are paginated by rank (keyset on rank and id,
+# ?after=RANK,ID&limit=N, the response links the next page), responses have an ETag (If-None-Match is answered with 304) and are
+# gzipped for clients accepting it
+# usage: python server.py [--host 127.0.0.1] [--port 8000] [--db companies.db] [--pool 8]
+#   GET /companies?ranks=START-END     companies ranked START to END, ?ranks=N the top N (like the rank window)
+#   GET /companies?industry=NAME       companies of an industry
+#   GET /companies?location=NAME       companies of a state
+#   GET /industries, /locations        names
+#   GET /trends/employees, /trends/year-founded, /trends/industry, /trends/location
+#                                      the four trend charts: histogram bins, counts per industry/state
+import argparse
+import gzip
+import hashlib
+import json
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from companies_db import DB_FILE
+from repository import Repository
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# smaller responses are sent as they are, compressing them saves nothing
+GZIP_MIN_SIZE = 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_ranks(text):
+    """
+    :param text: "N" (the top N) or "START-END", like the entry of NumDisplayWindow
+    :return: (start, end)
+    """
+    try:
+        parts = [int(part.strip()) for part in text.split('-')]
+    except ValueError:
+        raise HTTPError(400, f"ranks must be N or START-END, not {text!r}")
+    if len(parts) == 1:
+        parts.insert(0, 1)
+    if len(parts) != 2 or not 1 <= parts[0] <= parts[1]:
+        raise HTTPError(400, f"ranks must be N or START-END with 1 <= START <= END, not {text!r}")
+    return parts[0], parts[1]
+
+
+def parse_cursor(text):
+    """
+    :param text: "RANK,ID" of the last company of a page, ",ID" for a company without a rank
+    :return: (rank or None, id)
+    """
+    try:
+        rank, company_id = text.split(',')
+        return (int(rank) if rank else None), int(company_id)
+    except ValueError:
+        raise HTTPError(400, f"after must be RANK,ID or ,ID, not {text!r}")
+
+
+def parameter(params, name, default=None, convert=str):
+    """
+    :param params: parsed query string (parse_qs)
+    :return: the last value of the parameter, converted, default if missing
+    """
+    if name not in params:
+        return default
+    try:
+        return convert(params[name][-1])
+    except ValueError:
+        raise HTTPError(400, f"invalid {name}: {params[name][-1]!r}")
+
+
+class CompaniesServer(ThreadingHTTPServer):
+    # clients connecting at the same time wait in the listen queue instead of being refused
+    request_queue_size = 128
+    daemon_threads = True
+
+    def __init__(self, address, repository, verbose=False):
+        """
+        :param address: (host, port), port 0 picks a free one
+        :param repository: Repository the requests are answered from, closed with the server
+        :param verbose: log every request
+        """
+        super().__init__(address, RequestHandler)
+        self.repository = repository
+        self.verbose = verbose
+
+    def server_close(self):
+        super().server_close()
+        self.repository.close()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # keep-alive: a client sends all of its requests on one connection
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, with Nagle's algorithm the body waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            data = self.route(url.path.rstrip('/'), parse_qs(url.query))
+        except HTTPError as e:
+            self.send_json({'error': str(e)}, e.status)
+            return
+        except Exception as e:
+            # e.g. sqlite3 errors while 3_database.py rebuilds the schema: the client gets an answer
+            # instead of a dropped connection, the traceback goes to the server's stderr
+            traceback.print_exc()
+            self.send_json({'error': f"{type(e).__name__}: {e}"}, 500)
+            return
+        self.send_json(data)
+
+    def route(self, path, params):
+        """
+        :return: JSON-serializable response of a GET
+        """
+        repository = self.server.repository
+        if path == '/companies':
+            return self.companies(path, params)
+        elif path == '/industries':
+            return {'industries': repository.industries()}
+        elif path == '/locations':
+            return {'locations': repository.states()}
+        elif path in ('/trends/employees', '/trends/year-founded'):
+            return {'histogram': repository.histogram(path.split('/')[-1].replace('-', '_'))._asdict()}
+        elif path == '/trends/industry':
+            return {'counts': [{'industry': name, 'count': count} for name, count in repository.count_by_industry()]}
+        elif path == '/trends/location':
+            return {'counts': [{'location': name, 'count': count} for name, count in repository.count_by_state()]}
+        raise HTTPError(404, f"no such resource: {path}")
+
+    def companies(self, path, params):
+        """
+        A page of companies by rank range, industry or location, with the link to the next page
+        """
+        repository = self.server.repository
+        after = parameter(params, 'after', None, parse_cursor)
+        limit = parameter(params, 'limit', DEFAULT_LIMIT, int)
+        if not 1 <= limit <= MAX_LIMIT:
+            raise HTTPError(400, f"limit must be between 1 and {MAX_LIMIT}")
+        # one more than the page tells if there is a next page
+        if 'ranks' in params:
+            start, end = parse_ranks(parameter(params, 'ranks'))
+            page = repository.companies_by_rank(start, end, after, limit + 1)
+            query = {'ranks': parameter(params, 'ranks')}
+        elif 'industry' in params:
+            page = repository.companies_page('industry', parameter(params, 'industry'), after, None, limit + 1)
+            query = {'industry': parameter(params, 'industry')}
+        elif 'location' in params:
+            page = repository.companies_page('state', parameter(params, 'location'), after, None, limit + 1)
+            query = {'location': parameter(params, 'location')}
+        else:
+            raise HTTPError(400, "one of ranks, industry or location is needed")
+        next_page = None
+        if len(page) > limit:
+            page = page[:limit]
+            last = page[-1]
+            cursor = f"{'' if last.rank is None else last.rank},{last.id}"
+            next_page = path + '?' + urlencode({**query, 'after': cursor, 'limit': limit})
+        return {'companies': [company._asdict() for company in page], 'next': next_page}
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, separators=(',', ':')).encode()
+        # weak: the gzipped and the plain response are the same resource
+        etag = f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+        if status == 200 and etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) >= GZIP_MIN_SIZE
+        if gzipped:
+            body = gzip.compress(body, compresslevel=5)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if status == 200:
+            self.send_header('ETag', etag)
+            # clients may keep the response but have to revalidate it (cheap with If-None-Match)
+            self.send_header('Cache-Control', 'no-cache')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON queries of companies.db")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--pool', type=int, default=8, help="read-only connections, i.e. queries running at once")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args()
+    server = CompaniesServer((args.host, args.port), Repository(args.db, args.pool), args.verbose)
+    print(f"serving {args.db} on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
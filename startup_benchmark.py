@@ -0,0 +1,108 @@
+# startup benchmark of the GUI: import time of main.py (python -X importtime) and time from launching
+# python to the first drawn main window, compared with the baseline committed in the repository
+# (startup_baseline.json) so regressions are caught; fails (exit code 1) if it got slower or a heavy
+# module is imported at startup
+# usage: python startup_benchmark.py [--runs 5] [--save]
+#   --save overwrites the baseline, commit it together with the change that made startup faster or slower
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BASELINE_FILE = 'startup_baseline.json'
+# slower than the baseline by more than this fraction is a regression
+TOLERANCE = 0.25
+# only needed once a chart is opened, importing them with main.py is a regression
+HEAVY_MODULES = ('matplotlib', 'numpy', 'PIL')
+# the main window is drawn, then closed right away
+FIRST_WINDOW = '''
+import main
+window = main.MainWindow()
+window.update()
+print("ready", flush=True)
+window.windowClosing()
+'''
+
+
+def import_times():
+    """
+    :return: dict module -> cumulative import time in ms of the modules imported by a fresh `import main`,
+        in import order, main last
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    # lines "import time: self [us] | cumulative | imported package", the header has no number;
+    # a module comes after the ones it imports, indented one level less, so an unindented line ends the
+    # imports of one top-level module: the ones before main are interpreter startup (site, encodings)
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            name = parts[2].rstrip()
+            times[name.strip()] = int(parts[1]) / 1000
+            if not name.startswith('  ') and name.strip() != 'main':
+                times = {}
+    return times
+
+
+def first_window_time():
+    """
+    :return: ms from starting python to the main window being drawn, None if there is no display
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', FIRST_WINDOW], stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    elapsed = (time.perf_counter() - start) * 1000
+    process.communicate()
+    return elapsed if line.strip() == 'ready' else None
+
+
+def measure(runs):
+    """
+    :return: (median import ms, median first window ms or None, heavy modules imported, slowest imports)
+    """
+    imports = [import_times() for _ in range(runs)]
+    heavy = sorted({name.split('.')[0] for name in imports[0]} & set(HEAVY_MODULES))
+    slowest = sorted(((name, ms) for name, ms in imports[0].items() if name != 'main'),
+                     key=lambda item: item[1], reverse=True)[:5]
+    windows = [first_window_time() for _ in range(runs)]
+    window_ms = statistics.median(windows) if None not in windows else None
+    return statistics.median(times['main'] for times in imports), window_ms, heavy, slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="time the startup of main.py against the saved baseline")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--save', action='store_true', help=f"save the numbers as the new baseline ({BASELINE_FILE})")
+    args = parser.parse_args()
+
+    import_ms, window_ms, heavy, slowest = measure(args.runs)
+    print(f"import main: {import_ms:.0f} ms (median of {args.runs})")
+    for name, ms in slowest:
+        print(f"    {name}: {ms:.0f} ms")
+    print(f"first window: {window_ms:.0f} ms" if window_ms is not None else "first window: no display, not measured")
+
+    failures = [f"{name} imported at startup" for name in heavy]
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'r') as f:
+            baseline = json.load(f)
+        for label, value in (('import_ms', import_ms), ('first_window_ms', window_ms)):
+            if value is not None and baseline.get(label) is not None:
+                print(f"{label}: {value:.0f} ms, baseline {baseline[label]:.0f} ms")
+                if value > baseline[label] * (1 + TOLERANCE):
+                    failures.append(f"{label} {value:.0f} ms is over the baseline {baseline[label]:.0f} ms")
+    if args.save:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump({'import_ms': import_ms, 'first_window_ms': window_ms}, f, indent=3)
+        print(f"saved to {BASELINE_FILE}")
+    for failure in failures:
+        print("REGRESSION:", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
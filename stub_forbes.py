@@ -0,0 +1,168 @@
+# local stand-in for forbes.com, used to exercise the scraper without hitting the real site
+# the listing and profile pages are rendered from the records in companies_final.json
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+PROFILE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>{name} | Company Overview &amp; News</title></head>
+<body>
+<header class="header"><nav>{nav}</nav></header>
+<div class="profile-content">
+   <div class="profile-heading"><h1 class="listuser-header__name">{name}</h1></div>
+   <div class="profile-text"><span>{desc}</span></div>
+   <dl class="listuser-block__stats">
+      <div class="profile-stats__item"><span class="profile-stats__title">Industry</span><span class="profile-stats__text">{industry}</span></div>
+      <div class="profile-stats__item"><span class="profile-stats__title">Founded</span><span class="profile-stats__text">{year_founded}</span></div>
+      {headquarters}
+      <div class="profile-stats__item"><span class="profile-stats__title">Employees</span><span class="profile-stats__text">{employees}</span></div>
+   </dl>
+</div>
+<footer>{nav}</footer>
+</body>
+</html>
+"""
+
+LISTING_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title>America's Best Large Employers 2021</title></head>
+<body>
+<div id="row-3" class="row"><div><ul><li><div><div>
+<table class="fbs-table">
+<thead><tr><th>Rank</th><th>Name</th><th>Industry</th><th>Employees</th><th>Year Founded</th></tr></thead>
+<tbody>
+{rows}
+</tbody>
+</table>
+</div></div></li></ul></div></div>
+</body>
+</html>
+"""
+
+LISTING_ROW_TEMPLATE = ('<tr><td>{rank}</td><td><a href="{href}">{name}</a></td><td>{industry}</td>'
+                        '<td>{employees}</td><td>{year_founded}</td></tr>')
+
+HEADQUARTERS_TEMPLATE = ('<div class="profile-stats__item"><span class="profile-stats__title">Headquarters</span>'
+                         '<span class="profile-stats__text">{}</span></div>')
+
+# padding so that fixture pages weigh roughly as much as the real (script-heavy) ones
+NAV = "".join(f'<a class="header__link" href="/section-{i}/">Section {i}</a>' for i in range(400))
+
+
+def render_profile(company):
+    """
+    Render a fixture profile page for one company record,
+    missing fields ("-1") are left out of the page just like on forbes.com
+    """
+    headquarters = ""
+    if company.get('headquarters', "-1") != "-1":
+        headquarters = HEADQUARTERS_TEMPLATE.format(escape(company['headquarters']))
+    desc = company.get('desc', "-1")
+    return PROFILE_TEMPLATE.format(name=escape(company['name']), nav=NAV,
+                                   desc=escape(desc) if desc != "-1" else "",
+                                   industry=escape(company['industry']),
+                                   year_founded=escape(str(company['year_founded'])),
+                                   employees=escape(str(company['employees'])),
+                                   headquarters=headquarters)
+
+
+def render_listing(companies):
+    """
+    Render a fixture of the (already javascript-rendered) listing page,
+    profile links carry the list suffix and are relative like on forbes.com
+    """
+    rows = "\n".join(LISTING_ROW_TEMPLATE.format(rank=escape(company['rank']), name=escape(company['name']),
+                                                 href=escape(urlsplit(company['url']).path + "?list=best-employers/"),
+                                                 industry=escape(company['industry']),
+                                                 employees=escape(str(company['employees'])),
+                                                 year_founded=escape(str(company['year_founded'])))
+                     for company in companies)
+    return LISTING_TEMPLATE.format(rows=rows)
+
+
+def load_companies(path='companies_final.json'):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class StubForbes:
+    """
+    Threaded HTTP server serving fixture pages on localhost,
+    every `fail_every`-th request is answered with 429 so that retries get exercised
+    """
+    def __init__(self, companies, fail_every=0, latency=0.0):
+        self.pages = {urlsplit(company['url']).path: render_profile(company).encode()
+                      for company in companies}
+        self.pages['/best-large-employers/'] = render_listing(companies).encode()
+        self.fail_every = fail_every
+        self.latency = latency
+        self.request_times = []
+        self.statuses = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def url_for(self, company):
+        return self.base_url + urlsplit(company['url']).path
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.request_times.append(time.monotonic())
+                    count = len(stub.request_times)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.fail_every and count % stub.fail_every == 0:
+                    self.send_response(429)
+                    self.send_header('Retry-After', '0')
+                    self.end_headers()
+                    return
+                body = stub.pages.get(urlsplit(self.path).path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_response(self, code, message=None):
+                with stub._lock:
+                    stub.statuses[code] += 1
+                super().send_response(code, message)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
@@ -0,0 +1,153 @@
+# background tasks of the GUI: queries and formatting run on worker threads, their results are handed
+# back to the Tk thread through a queue polled with after(), so the event loop never waits for the database
+# (Tk widgets may only be touched from the Tk thread, the callbacks are run there)
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# how often the Tk thread looks for finished tasks, about one frame
+POLL_MS = 16
+
+
+class Task:
+    def __init__(self, work, on_done, on_error):
+        self.work = work
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        The callbacks of a cancelled task are never called
+        """
+        self.cancelled = True
+
+
+class TaskRunner:
+    """
+    Runs functions on a thread pool and calls their callbacks on the Tk thread
+    """
+    def __init__(self, widget, pool=None, workers=2, on_busy=None):
+        """
+        :param widget: any Tk widget, its after() schedules the polling
+        :param pool: repository.ConnectionPool the tasks query through, interrupted by cancel_all
+        :param workers: number of worker threads
+        :param on_busy: function(bool) called on the Tk thread when the first task starts / the last one ends
+        """
+        self._widget = widget
+        self._pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='task')
+        self._finished = queue.Queue()
+        self._running = set()
+        self._on_busy = on_busy
+        self._closed = False
+        self._widget.after(POLL_MS, self._poll)
+
+    def submit(self, work, on_done, on_error=None):
+        """
+        :param work: function without arguments, run on a worker thread (no Tk calls in there)
+        :param on_done: function(result) called on the Tk thread
+        :param on_error: function(exception) called on the Tk thread, the exception is re-raised there if None
+        :return: Task
+        """
+        task = Task(work, on_done, on_error)
+        if not self._running and self._on_busy is not None:
+            self._on_busy(True)
+        self._running.add(task)
+        self._executor.submit(self._run, task)
+        return task
+
+    def _run(self, task):
+        if task.cancelled:
+            self._finished.put((task, None, None))
+            return
+        try:
+            self._finished.put((task, task.work(), None))
+        except Exception as e:
+            self._finished.put((task, None, e))
+
+    def _poll(self):
+        if self._closed:
+            return
+        # scheduled first: a callback may open a modal window (wait_window) and results have to keep coming
+        self._widget.after(POLL_MS, self._poll)
+        while True:
+            try:
+                task, result, error = self._finished.get_nowait()
+            except queue.Empty:
+                return
+            self._running.discard(task)
+            if not self._running and self._on_busy is not None:
+                self._on_busy(False)
+            if task.cancelled:
+                continue
+            if error is None:
+                task.on_done(result)
+            elif task.on_error is not None:
+                task.on_error(error)
+            else:
+                raise error
+
+    def busy(self):
+        return len(self._running) != 0
+
+    def cancel_all(self):
+        """
+        Cancel every task: queued ones won't run, running queries are interrupted
+        """
+        for task in list(self._running):
+            task.cancel()
+        if self._pool is not None:
+            self._pool.interrupt()
+
+    def shutdown(self):
+        """
+        Cancel every task and wait for the worker threads (interrupted queries end right away),
+        after this the connections of the pool can be closed
+        """
+        self._closed = True
+        self.cancel_all()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def demo(seconds=3):
+    """
+    A query running for several seconds in the background while the Tk event loop keeps ticking:
+    prints the longest gap between two 5 ms timer events, then cancels the query (needs a display)
+    """
+    import tkinter as tk
+    from repository import ConnectionPool
+
+    root = tk.Tk()
+    pool = ConnectionPool(size=1)
+    runner = TaskRunner(root, pool, on_busy=lambda busy: print("busy" if busy else "idle"))
+    gaps = []
+    last = [time.perf_counter()]
+
+    def tick():
+        now = time.perf_counter()
+        gaps.append(now - last[0])
+        last[0] = now
+        root.after(5, tick)
+
+    def slow_query():
+        with pool.connection() as conn:
+            return conn.execute('''WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n)
+                                   SELECT COUNT(*) FROM (SELECT i FROM n LIMIT 1000000000)''').fetchone()
+
+    def finish():
+        runner.shutdown()
+        print(f"longest gap of the event loop: {max(gaps) * 1000:.1f} ms ({len(gaps)} ticks)")
+        pool.close()
+        root.destroy()
+
+    runner.submit(slow_query, lambda result: print("finished", result),
+                  lambda e: print("failed", e) if not isinstance(e, sqlite3.OperationalError) else None)
+    root.after(5, tick)
+    root.after(seconds * 1000, finish)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    demo()
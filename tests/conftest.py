@@ -0,0 +1,33 @@
+# the modules are scripts in the repository root, some of them named like 3_database.py
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_script(name):
+    """
+    :param name: file name without .py, e.g. '3_database'
+    :return: the module
+    """
+    return importlib.import_module(name)
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    :return: path of a new companies database with 2000 synthetic companies loaded (snapshot of 2021)
+    """
+    loader = load_script('3_database')
+    path = str(tmp_path / 'companies.db')
+    conn = loader.connect(path)
+    loader.create_schema(conn.cursor())
+    loader.load_bulk(conn, loader.synthetic_companies(2000))
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    return path
@@ -0,0 +1,49 @@
+# long session: charts opened and closed again and again leave no Figure, image or object behind
+import tkinter as tk
+
+import pytest
+
+import main
+from repository import Repository
+
+
+@pytest.fixture
+def chart_data(database):
+    repository = Repository(database, pool_size=1)
+    try:
+        return {1: repository.histogram('employees'), 2: repository.histogram('year_founded'),
+                3: repository.count_by_industry(), 4: repository.count_by_state()}
+    finally:
+        repository.close()
+
+
+def assert_flat(samples):
+    # the first count is taken after the warm-up (matplotlib imports, font cache)
+    assert [figures for opened, objects, figures, ms in samples] == [0] * len(samples)
+    assert max(objects for opened, objects, figures, ms in samples) - samples[0][1] <= main.MEMORY_TOLERANCE
+
+
+def test_redrawn_charts_are_released(chart_data):
+    main.CHART_CACHE.clear()
+    assert_flat(main.chartCycles(chart_data, 40, every=8, redrawn=40))
+
+
+def test_cached_charts_are_released(chart_data):
+    main.CHART_CACHE.clear()
+    assert_flat(main.chartCycles(chart_data, 200, every=40, redrawn=0))
+    assert len(main.CHART_CACHE) == len(chart_data)
+
+
+def test_plot_windows_are_released(chart_data):
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display: PlotWindow and its PhotoImage can't be created")
+    try:
+        root.withdraw()
+        main.CHART_CACHE.clear()
+        assert_flat(main.chartCycles(chart_data, 80, root, every=16, redrawn=16))
+        # every PhotoImage was deleted with its window
+        assert root.tk.call('image', 'names') == ''
+    finally:
+        root.destroy()
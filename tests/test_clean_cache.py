@@ -0,0 +1,77 @@
+# the cached cleaner: same output as cleaning everything, and a bounded read-ahead when misses are sparse
+import copy
+import os
+from collections import deque
+
+from clean_cache import CleanCache, clean_records_cached, rules_fingerprint
+from cleaning import clean_records, load_colleges, make_rules
+from college_index import load_index
+from conftest import ROOT
+from stub_forbes import load_companies
+
+COLLEGES = os.path.join(ROOT, 'topcolleges.csv')
+
+
+def read_ahead_cleaner(records, window=8000):
+    """
+    Stand-in for clean_records_parallel: reads up to window records ahead before returning the first,
+    the "cleaned" record is the raw one with a mark
+    """
+    records = iter(records)
+    pending = deque()
+    while True:
+        while len(pending) < window:
+            company = next(records, None)
+            if company is None:
+                break
+            pending.append(company)
+        if not pending:
+            return
+        yield {**pending.popleft(), 'cleaned': True}
+
+
+def test_same_output_as_cleaning_everything(tmp_path):
+    companies = load_companies(os.path.join(ROOT, 'companies_final.json'))
+    rules = make_rules(load_colleges(COLLEGES), load_index(COLLEGES))
+    fingerprint = rules_fingerprint(COLLEGES)
+    # the cleaner changes the records it is given
+    expected = list(clean_records(copy.deepcopy(companies), rules))
+
+    cache = CleanCache(str(tmp_path / 'cache.db'))
+    list(clean_records_cached(copy.deepcopy(companies[::3]), lambda raw: clean_records(raw, rules), cache,
+                              fingerprint, batch_size=20))
+    cache.hits = cache.misses = 0
+    cleaned = list(clean_records_cached(copy.deepcopy(companies), lambda raw: clean_records(raw, rules), cache,
+                                        fingerprint, batch_size=20))
+    cache.close()
+    assert cleaned == expected
+    assert (cache.hits, cache.misses) == (len(companies[::3]), len(companies) - len(companies[::3]))
+
+
+def test_read_ahead_is_bounded(tmp_path):
+    n, batch_size = 60000, 1000
+    companies = [{'name': f'Company {i}', 'url': f'https://www.forbes.com/companies/company-{i}/'} for i in range(n)]
+    cache = CleanCache(str(tmp_path / 'cache.db'))
+    list(clean_records_cached(companies, read_ahead_cleaner, cache, 'rules', batch_size))
+
+    # one early miss and one late miss, everything else is in the cache
+    changed = [dict(company) for company in companies]
+    changed[10]['url'] += 'new/'
+    changed[n - 10]['url'] += 'new/'
+    read = 0
+
+    def records():
+        nonlocal read
+        for company in changed:
+            read += 1
+            yield company
+
+    cache.hits = cache.misses = 0
+    most_ahead = 0
+    for done, company in enumerate(clean_records_cached(records(), read_ahead_cleaner, cache, 'rules', batch_size)):
+        assert company['name'] == changed[done]['name']
+        most_ahead = max(most_ahead, read - done)
+    cache.close()
+    assert (cache.hits, cache.misses) == (n - 2, 2)
+    # the records waiting in memory: up to two batches of cached ones, not the whole input
+    assert most_ahead <= 3 * batch_size
@@ -0,0 +1,47 @@
+# exports switch versions through the pointer file: readers never find the snapshot missing
+import sqlite3
+import threading
+
+from columnar import export_snapshot, latest_path, load_latest
+
+
+def test_export_replaces_the_current_version(database, tmp_path):
+    directory = str(tmp_path / 'snapshots')
+    conn = sqlite3.connect(database)
+    try:
+        first = export_snapshot(conn, 1, directory)
+        assert latest_path(directory=directory) == first
+        second = export_snapshot(conn, 1, directory)
+        third = export_snapshot(conn, 1, directory)
+    finally:
+        conn.close()
+    snapshot = load_latest(directory=directory)
+    assert snapshot.path == third != second
+    assert len(snapshot) == 2000
+    # the version before the current one is kept, older ones are removed
+    assert sorted(path.name for path in (tmp_path / 'snapshots').iterdir()) == \
+        ['best-large-employers-2021.2', 'best-large-employers-2021.3', 'best-large-employers-2021.current']
+
+
+def test_readers_always_find_a_snapshot(database, tmp_path):
+    directory = str(tmp_path / 'snapshots')
+    conn = sqlite3.connect(database)
+    export_snapshot(conn, 1, directory)
+    missing = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            if load_latest(directory=directory) is None:
+                missing.append(1)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for _ in range(20):
+            export_snapshot(conn, 1, directory)
+    finally:
+        done.set()
+        reader.join()
+        conn.close()
+    assert missing == []
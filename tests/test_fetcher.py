@@ -0,0 +1,34 @@
+# the fetcher against the local stub of forbes.com: every page arrives, never faster than the per-host ceiling
+import os
+
+import pytest
+
+from conftest import ROOT
+from fetcher import Fetcher
+from stub_forbes import StubForbes, load_companies
+
+RATE = 40.0
+
+
+@pytest.fixture(scope='module')
+def companies():
+    return load_companies(os.path.join(ROOT, 'companies_final.json'))[:60]
+
+
+@pytest.mark.parametrize('workers', [1, 8])
+def test_rate_ceiling(companies, workers):
+    # every 10th request is answered with 429, the retries count against the ceiling too
+    with StubForbes(companies, fail_every=10, latency=0.05) as stub:
+        urls = [stub.url_for(company) for company in companies]
+        fetcher = Fetcher(max_workers=workers, rate_per_host=RATE, backoff=0.01)
+        pages = dict(fetcher.fetch_all(urls))
+        times = sorted(stub.request_times)
+
+    assert sorted(pages) == sorted(urls)
+    assert all(page is not None and page.status_code == 200 for page in pages.values())
+    assert stub.statuses[429] > 0
+    assert len(times) == len(urls) + stub.statuses[429]
+    # the bucket holds one token: requests start at least 1/RATE apart, the arrival at the server may
+    # jitter a little, so the ceiling is checked over the whole run and over every window of 10 requests
+    assert (len(times) - 1) / (times[-1] - times[0]) <= RATE * 1.05
+    assert all(9 / (times[i + 9] - times[i]) <= RATE * 1.2 for i in range(len(times) - 9))
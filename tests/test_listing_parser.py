@@ -0,0 +1,47 @@
+# the listing is parsed from fixture pages rendered by stub_forbes.py
+import os
+
+import pytest
+
+from conftest import ROOT
+from listing_parser import parse_listing, parse_listing_html
+from stub_forbes import LISTING_ROW_TEMPLATE, load_companies, render_listing
+
+FIELDS = ("rank", "name", "industry", "employees", "year_founded", "url")
+
+COMPANIES = [
+    {"rank": "1", "name": "Costco Wholesale", "industry": "Retail and Wholesale", "employees": "273,000",
+     "year_founded": "1976", "url": "https://www.forbes.com/companies/costco-wholesale/"},
+    {"rank": "2", "name": "Procter & Gamble", "industry": "Consumer Products", "employees": "101,000",
+     "year_founded": "1837", "url": "https://www.forbes.com/companies/procter-gamble/"},
+    {"rank": "3", "name": "A. O. Smith", "industry": "Engineering, Manufacturing", "employees": "13,700",
+     "year_founded": "1874", "url": "https://www.forbes.com/companies/a-o-smith/"},
+]
+
+
+def test_parse_fixture():
+    assert parse_listing_html(render_listing(COMPANIES)) == COMPANIES
+
+
+def test_parse_companies_final():
+    companies = load_companies(os.path.join(ROOT, 'companies_final.json'))
+    assert parse_listing(render_listing(companies).encode()) == [{key: company[key] for key in FIELDS}
+                                                                 for company in companies]
+
+
+def test_short_rows_are_skipped():
+    page = render_listing(COMPANIES).replace(
+        LISTING_ROW_TEMPLATE.format(rank=1, href="/companies/costco-wholesale/?list=best-employers/",
+                                    name="Costco Wholesale", industry="Retail and Wholesale", employees="273,000",
+                                    year_founded=1976),
+        '<tr><td>1</td><td>Costco Wholesale</td></tr>')
+    assert parse_listing_html(page) == COMPANIES[1:]
+
+
+def test_page_without_companies():
+    with pytest.raises(ValueError):
+        parse_listing_html('<html><body><table><tr><td>note</td><td>only two cells</td></tr></table></body></html>')
+    with pytest.raises(ValueError):
+        parse_listing_html(render_listing([]))
+    with pytest.raises(ValueError):
+        parse_listing('[]')
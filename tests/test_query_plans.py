@@ -0,0 +1,31 @@
+# every GUI query has to be answered through the indexes, on a loaded and analyzed database
+import sqlite3
+
+from companies_db import QUERIES, check_query_plans, query_plan
+
+
+def test_no_full_scans(database):
+    conn = sqlite3.connect(database)
+    try:
+        assert check_query_plans(conn.cursor()) == []
+    finally:
+        conn.close()
+
+
+def test_scans_are_reported(database):
+    conn = sqlite3.connect(database)
+    try:
+        queries = {'unindexed': 'SELECT name FROM Companies WHERE desc = ?'}
+        assert [name for name, step in check_query_plans(conn.cursor(), queries)] == ['unindexed']
+        assert all(query_plan(conn.cursor(), sql) for sql in QUERIES.values())
+    finally:
+        conn.close()
+
+
+def test_small_tables_may_be_scanned(database):
+    conn = sqlite3.connect(database)
+    try:
+        queries = {'snapshots': 'SELECT s.year FROM Snapshots AS s WHERE s.year > ?'}
+        assert check_query_plans(conn.cursor(), queries) == []
+    finally:
+        conn.close()
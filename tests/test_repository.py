@@ -0,0 +1,23 @@
+# the repository follows the database: a newly loaded year is served without restarting
+from conftest import load_script
+from repository import Repository
+
+
+def test_new_year_is_served(database):
+    loader = load_script('3_database')
+    repository = Repository(database, pool_size=2)
+    try:
+        assert repository.company_by_rank(1)[0].name == 'Company 0'
+        first_snapshot = repository.snapshot
+
+        renamed = ({**company, 'name': company['name'] + ' 2022'} for company in loader.synthetic_companies(10))
+        conn = loader.connect(database)
+        loader.load_bulk(conn, renamed, default_year=2022)
+        conn.close()
+
+        assert repository.company_by_rank(1)[0].name == 'Company 0 2022'
+        assert repository.snapshot != first_snapshot
+        assert len(repository.companies_by_rank(1, 500, limit=500)) == 10
+        assert repository.cache.invalidations == 1
+    finally:
+        repository.close()